@@ -0,0 +1,222 @@
+from typing import List, Tuple
+
+import os
+import csv
+import argparse
+import numpy
+
+parser = argparse.ArgumentParser(description="Convert a csv dataset to binary formats")
+parser.add_argument("dataset_path", type=str)
+parser.add_argument("--out_path", type=str, default=None)
+parser.add_argument("--edge_list", action="store_true")
+
+DIST_FILE_NAME = "dist.npy"
+SQUARED_DIST_FILE_NAME = "d2.npy"
+OMEGA_FILE_NAME = "omega.npy"
+NAMES_FILE_NAME = "names.txt"
+EDGES_FILE_NAME = "edges.npz"
+
+
+def count_csv_rows(csv_path: str) -> int:
+    with open(csv_path, "r") as csv_file:
+        return sum(1 for line in csv_file if line.strip())
+
+
+def iterate_csv_rows(csv_path: str, dtype: numpy.dtype = numpy.float64):
+    with open(csv_path, "r") as csv_file:
+        for line in csv_file:
+            if line.strip():
+                yield numpy.array(line.split(","), dtype=dtype)
+
+
+def stream_csv_to_npy(csv_path: str, npy_path: str, dtype: numpy.dtype = numpy.float64):
+    """
+    Converts a square csv matrix to .npy one row at a time, so that the full
+    matrix is never held in memory
+
+    :param csv_path: path to square csv matrix
+    :param npy_path: path to write .npy matrix to
+    :param dtype: dtype to store the matrix as
+    """
+    num_rows = count_csv_rows(csv_path)
+    matrix = numpy.lib.format.open_memmap(
+        npy_path,
+        mode="w+",
+        dtype=dtype,
+        shape=(num_rows, num_rows)
+    )
+    for row_i, row in enumerate(iterate_csv_rows(csv_path, dtype=numpy.float64)):
+        matrix[row_i] = row
+
+    matrix.flush()
+    del matrix
+
+
+def write_squared_distances(dist_path: str, squared_dist_path: str, block_rows: int = 1024):
+    """
+    Squares a .npy distance matrix into a new .npy file one block of rows at
+    a time, so that neither matrix is held in memory
+
+    :param dist_path: path to .npy distance matrix
+    :param squared_dist_path: path to write the squared distance matrix to
+    :param block_rows: number of rows squared at once
+    """
+    dist = numpy.load(dist_path, mmap_mode="r")
+    squared_dist = numpy.lib.format.open_memmap(
+        squared_dist_path,
+        mode="w+",
+        dtype=dist.dtype,
+        shape=dist.shape
+    )
+    for block_start in range(0, dist.shape[0], block_rows):
+        block_stop = block_start + block_rows
+        numpy.square(dist[block_start: block_stop], out=squared_dist[block_start: block_stop])
+
+    squared_dist.flush()
+    del squared_dist
+
+
+def write_names(dataset_path: str, out_path: str):
+    """
+    Converts names.csv to names.txt with one name per line
+
+    :param dataset_path: directory containing names.csv
+    :param out_path: directory to write names.txt to
+    """
+    with open(os.path.join(dataset_path, "names.csv"), "r") as csv_file:
+        names = next(csv.reader(csv_file))
+    with open(os.path.join(out_path, NAMES_FILE_NAME), "w") as names_file:
+        names_file.write("\n".join(name.strip() for name in names))
+
+
+def convert_csv_dataset(dataset_path: str, out_path: str = None):
+    """
+    Converts dist.csv, omega.csv and names.csv to dist.npy, d2.npy, omega.npy
+    and names.txt, which can then be memory mapped by load_dataset and load_d
+
+    :param dataset_path: directory containing the csv dataset
+    :param out_path: directory to write to, defaults to dataset_path
+    """
+    out_path = out_path or dataset_path
+    os.makedirs(out_path, exist_ok=True)
+
+    stream_csv_to_npy(
+        os.path.join(dataset_path, "dist.csv"),
+        os.path.join(out_path, DIST_FILE_NAME),
+        dtype=numpy.float64
+    )
+    write_squared_distances(
+        os.path.join(out_path, DIST_FILE_NAME),
+        os.path.join(out_path, SQUARED_DIST_FILE_NAME)
+    )
+    stream_csv_to_npy(
+        os.path.join(dataset_path, "omega.csv"),
+        os.path.join(out_path, OMEGA_FILE_NAME),
+        dtype=numpy.bool_
+    )
+
+    write_names(dataset_path, out_path)
+
+
+def convert_csv_dataset_to_edge_list(dataset_path: str, out_path: str = None):
+    """
+    Converts dist.csv and omega.csv to an edge list of the known pairs in the
+    upper triangle, stored as rows, columns and distances arrays in
+    edges.npz, and names.csv to names.txt, which also fixes the number of
+    points. Rows are streamed so that only the edges are held in memory
+
+    :param dataset_path: directory containing the csv dataset
+    :param out_path: directory to write to, defaults to dataset_path
+    """
+    out_path = out_path or dataset_path
+    os.makedirs(out_path, exist_ok=True)
+
+    rows, columns, distances = [], [], []
+    dist_rows = iterate_csv_rows(os.path.join(dataset_path, "dist.csv"))
+    omega_rows = iterate_csv_rows(os.path.join(dataset_path, "omega.csv"))
+    for row_i, (dist_row, omega_row) in enumerate(zip(dist_rows, omega_rows)):
+        row_columns = numpy.flatnonzero(omega_row[row_i + 1:]) + row_i + 1
+        rows.append(numpy.full(len(row_columns), row_i))
+        columns.append(row_columns)
+        distances.append(dist_row[row_columns])
+
+    numpy.savez(
+        os.path.join(out_path, EDGES_FILE_NAME),
+        rows=numpy.concatenate(rows),
+        columns=numpy.concatenate(columns),
+        distances=numpy.concatenate(distances),
+    )
+    write_names(dataset_path, out_path)
+
+
+def load_dataset(
+    dataset_path: str,
+    mmap_mode: str = "r",
+) -> Tuple[numpy.ndarray, numpy.ndarray, List[str]]:
+    """
+    :param dataset_path: directory containing dist.npy, omega.npy and names.txt
+    :param mmap_mode: numpy memory map mode. "r" is zero-copy, "c" is
+        copy-on-write which allows modifying in place without touching the file
+    :return: distance matrix, omega matrix and names
+    """
+    dist = numpy.load(os.path.join(dataset_path, DIST_FILE_NAME), mmap_mode=mmap_mode)
+    omega = numpy.load(os.path.join(dataset_path, OMEGA_FILE_NAME), mmap_mode="r")
+    names = load_names(dataset_path)
+
+    return dist, omega, names
+
+
+def load_d(dataset_path: str) -> numpy.ndarray:
+    """
+    Squaring dist.npy in memory would dirty every page of the map, so the
+    squared distances are stored once in d2.npy. Datasets converted without
+    it have d2.npy written on first load
+
+    :param dataset_path: directory containing dist.npy
+    :return: read only memory map of the squared distance matrix
+    """
+    squared_dist_path = os.path.join(dataset_path, SQUARED_DIST_FILE_NAME)
+    if not os.path.exists(squared_dist_path):
+        write_squared_distances(os.path.join(dataset_path, DIST_FILE_NAME), squared_dist_path)
+
+    return numpy.load(squared_dist_path, mmap_mode="r")
+
+
+def load_edge_list(dataset_path: str) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    :param dataset_path: directory containing edges.npz
+    :return: rows, columns and distances arrays of the known pairs
+    """
+    with numpy.load(os.path.join(dataset_path, EDGES_FILE_NAME)) as edges:
+        return edges["rows"], edges["columns"], edges["distances"]
+
+
+def load_names(dataset_path: str) -> List[str]:
+    with open(os.path.join(dataset_path, NAMES_FILE_NAME), "r") as names_file:
+        return names_file.read().split("\n")
+
+
+def apply_sparsity(omega: numpy.ndarray, sparsity: float, block_rows: int = 1024):
+    """
+    Randomly forgets known distances in place, one block of rows at a time so
+    that the random mask never needs to be the size of omega
+
+    :param omega: matrix with nonzero entries where the distance is known
+    :param sparsity: probability of forgetting each entry
+    :param block_rows: number of rows masked at once
+    """
+    if sparsity <= 0.0:
+        return
+
+    for block_start in range(0, omega.shape[0], block_rows):
+        block = omega[block_start: block_start + block_rows]
+        block[numpy.random.rand(*block.shape) < sparsity] = 0
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if args.edge_list:
+        convert_csv_dataset_to_edge_list(args.dataset_path, args.out_path)
+    else:
+        convert_csv_dataset(args.dataset_path, args.out_path)
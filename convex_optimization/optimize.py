@@ -1,12 +1,16 @@
-from typing import Optional
+from typing import Dict, Optional
 
 import os
 import sys
 import csv
+import time
 import numpy
 import cvxpy as cp
+import scipy.linalg
+import scipy.sparse
+import scipy.sparse.linalg
 
-import matplotlib.pyplot as plt
+from dataset import apply_sparsity, load_dataset, load_d, DIST_FILE_NAME
 
 
 def read_matrix_from_csv(csv_path: str):
@@ -16,10 +20,7 @@ def read_matrix_from_csv(csv_path: str):
 
 def read_omega_from_csv(csv_path: str, sparsity: float = 0.0):
     omega = read_matrix_from_csv(csv_path)
-    for y in range(omega.shape[0]):
-        for x in range(omega.shape[1]):
-            if numpy.random.rand() < sparsity:
-                omega[x, y] = 0
+    apply_sparsity(omega, sparsity)
 
     return omega
 
@@ -34,45 +35,377 @@ def read_names_from_csv(csv_path: str):
 
 def read_d_from_dist_csv(csv_path: str):
     dist = read_matrix_from_csv(csv_path)
-    return dist * dist
+    return numpy.square(dist, out=dist)
 
 
-def optimize_gram_matrix(D: numpy.ndarray, omega: numpy.ndarray, margin: float = 0.0):
+def get_known_pairs(omega: numpy.ndarray):
+    """
+    :param omega: matrix with nonzero entries where the distance is known
+    :return: row and column index arrays of the known pairs in the strict
+        upper triangle. (i, j) and (j, i) describe the same constraint and the
+        diagonal is trivially satisfied, so neither is returned
+    """
+    known = numpy.logical_or(omega != 0, omega.T != 0)
+    return numpy.nonzero(numpy.triu(known, k=1))
+
+
+def is_complete(omega: numpy.ndarray, block_rows: int = 1024):
+    """
+    Checks one block of rows at a time, so scratch memory is
+    O(block_rows * N) rather than the O(N^2) of get_known_pairs
+
+    :param omega: matrix with nonzero entries where the distance is known
+    :param block_rows: number of rows checked at once
+    :return: True if every off diagonal pair is known in either direction
+    """
+    num_points = omega.shape[0]
+    for block_start in range(0, num_points, block_rows):
+        block_stop = min(block_start + block_rows, num_points)
+        known = numpy.logical_or(
+            omega[block_start: block_stop] != 0,
+            omega[:, block_start: block_stop].T != 0
+        )
+        num_diagonal_unknown = block_stop - block_start - numpy.count_nonzero(
+            known[numpy.arange(block_stop - block_start), numpy.arange(block_start, block_stop)]
+        )
+        if numpy.count_nonzero(known) + num_diagonal_unknown < known.size:
+            return False
+
+    return True
+
+
+def optimize_gram_matrix(
+    D: numpy.ndarray,
+    omega: numpy.ndarray,
+    margin: float = 0.0,
+    solver: Optional[str] = None,
+    warm_start_X: Optional[numpy.ndarray] = None,
+    timings: Optional[Dict[str, float]] = None,
+):
+    """
+    :param D: matrix of squared distances
+    :param omega: matrix with nonzero entries where the distance is known
+    :param margin: relative error allowed in each squared distance
+    :param solver: cvxpy solver name such as "SCS" or "CLARABEL", defaults to
+        the cvxpy default
+    :param warm_start_X: initial gram matrix, such as a previous solution, to
+        warm start solvers which support it
+    :param timings: if given, filled with the seconds spent on
+        "construction" of the cvxpy problem, cvxpy "compilation" into solver
+        form, the "solver" itself and the "total"
+    :return: optimal gram matrix or None if the problem could not be solved
+    """
+    start_time = time.perf_counter()
+
     # variables
     X = cp.Variable(D.shape, symmetric=True)
+    if warm_start_X is not None:
+        X.value = warm_start_X
+
+    # distance constraints as one affine expression over all known pairs
+    rows, columns = get_known_pairs(omega)
+    X_diagonal = cp.diag(X)
+    distances = X_diagonal[rows] + X_diagonal[columns] - 2 * X[rows, columns]
+    target_distances = D[rows, columns]
 
     # construct problem
     objective = cp.Minimize(cp.trace(X))
     constraints = [X >> 0]
-    for (i, j), is_distance_known in numpy.ndenumerate(omega):
-        if is_distance_known:
-            if margin == 0.0:
-                constraints.append(X[i, i] + X[j, j] - 2*X[i, j] == D[i, j])
-            else:
-                constraints.append(X[i, i] + X[j, j] - 2*X[i, j] >= D[i, j] * (1 - margin))
-                constraints.append(X[i, i] + X[j, j] - 2*X[i, j] <= D[i, j] * (1 + margin))
+    if len(rows) > 0:
+        if margin == 0.0:
+            constraints.append(distances == target_distances)
+        else:
+            constraints.append(distances >= target_distances * (1 - margin))
+            constraints.append(distances <= target_distances * (1 + margin))
 
     # solve and print
     problem = cp.Problem(objective, constraints)
-    result = problem.solve()
+    construction_time = time.perf_counter() - start_time
+    try:
+        result = problem.solve(solver=solver, warm_start=warm_start_X is not None)
+    finally:
+        if timings is not None:
+            timings["construction"] = construction_time
+            timings["compilation"] = problem.compilation_time or 0.0
+            timings["solver"] = problem.solver_stats.solve_time if problem.solver_stats else None
+            timings["total"] = time.perf_counter() - start_time
 
     return X.value
 
 
-def calculate_points(X: numpy.ndarray, num_spatial_dims: int = 2):
-    eigen_values, eigen_vectors = numpy.linalg.eig(X)
+def calculate_points(
+    X: numpy.ndarray,
+    num_spatial_dims: int = 2,
+    dtype: numpy.dtype = numpy.float64,
+):
+    """
+    :param X: symmetric positive semidefinite gram matrix
+    :param num_spatial_dims: number of spatial dimensions
+    :param dtype: dtype of the returned points, the decomposition itself is
+        always computed in float64
+    :return: points P with shape (num_spatial_dims, N)
+    """
+    eigen_values, eigen_vectors = top_eigenpairs(X, num_spatial_dims)
 
-    D = numpy.zeros((num_spatial_dims, num_spatial_dims))
-    numpy.fill_diagonal(D, eigen_values[:num_spatial_dims])
-    D_sqrt = numpy.sqrt(D)
+    # negative eigenvalues are numerical noise of a PSD matrix
+    D_sqrt = numpy.diag(numpy.sqrt(numpy.maximum(eigen_values, 0.0)))
 
-    U = eigen_vectors[:, :num_spatial_dims]
+    U = eigen_vectors
 
     P = D_sqrt @ U.T
+    return P.astype(dtype, copy=False)
+
+
+def top_eigenpairs(
+    X: numpy.ndarray,
+    num_eigenpairs: int,
+    max_dense_size: int = 2000,
+):
+    """
+    Computes only the largest eigenpairs of a symmetric matrix. Small matrices
+    use a partial LAPACK decomposition, larger ones use Lanczos iteration
+    (ARPACK) which costs roughly O(N^2) per requested eigenpair instead of a
+    full O(N^3) decomposition
+
+    :param X: symmetric matrix
+    :param num_eigenpairs: number of eigenpairs to return
+    :param max_dense_size: largest matrix decomposed with LAPACK
+    :return: the largest eigenvalues in descending order and their
+        eigenvectors as columns
+    """
+    size = X.shape[0]
+    num_eigenpairs = min(num_eigenpairs, size)
+
+    if size <= max_dense_size or num_eigenpairs >= size - 1:
+        eigen_values, eigen_vectors = scipy.linalg.eigh(
+            X,
+            subset_by_index=[size - num_eigenpairs, size - 1]
+        )
+    else:
+        eigen_values, eigen_vectors = scipy.sparse.linalg.eigsh(
+            X,
+            k=num_eigenpairs,
+            which="LA"
+        )
+
+    order = numpy.argsort(eigen_values)[::-1]
+    return eigen_values[order], eigen_vectors[:, order]
+
+
+def classical_mds(D: numpy.ndarray, num_spatial_dims: int = 2):
+    """
+    Classical multidimensional scaling of a complete squared distance matrix.
+    The double centered matrix -1/2 J D J is the gram matrix of the centered
+    points, so no semidefinite program is needed
+
+    :param D: complete matrix of squared distances
+    :param num_spatial_dims: number of spatial dimensions
+    :return: points P with shape (num_spatial_dims, N)
+    """
+    row_means = numpy.mean(D, axis=1, keepdims=True)
+    column_means = numpy.mean(D, axis=0, keepdims=True)
+    B = -0.5 * (D - row_means - column_means + numpy.mean(D))
+
+    return calculate_points(B, num_spatial_dims=num_spatial_dims)
+
+
+def landmark_mds(
+    D: numpy.ndarray,
+    num_spatial_dims: int = 2,
+    num_landmarks: int = 100,
+    omega: Optional[numpy.ndarray] = None,
+):
+    """
+    Landmark MDS (de Silva and Tenenbaum). Classical MDS is run on a small
+    set of landmarks chosen by max-min distance, then every other point is
+    placed by triangulating its distances to the landmarks. Only the
+    landmark rows of D are read, so this costs O(num_landmarks * N)
+
+    :param D: matrix of squared distances, only the landmark rows need to be
+        known
+    :param num_spatial_dims: number of spatial dimensions
+    :param num_landmarks: number of landmarks
+    :param omega: matrix with nonzero entries where the distance is known,
+        used to check that the landmark rows are complete
+    :return: points P with shape (num_spatial_dims, N)
+    """
+    num_points = D.shape[0]
+    num_landmarks = min(max(num_landmarks, num_spatial_dims + 1), num_points)
+
+    # max-min landmark selection
+    landmarks = [0]
+    min_distances = numpy.array(D[0], dtype=numpy.float64)
+    for _ in range(num_landmarks - 1):
+        landmark = int(numpy.argmax(min_distances))
+        landmarks.append(landmark)
+        numpy.minimum(min_distances, D[landmark], out=min_distances)
+    landmarks = numpy.array(landmarks)
+
+    landmark_rows = numpy.array(D[landmarks], dtype=numpy.float64)
+    if omega is not None:
+        known = numpy.logical_or(omega[landmarks] != 0, omega[:, landmarks].T != 0)
+        known[numpy.arange(num_landmarks), landmarks] = True
+        if not numpy.all(known):
+            raise ValueError("Landmark MDS requires complete distances from every landmark")
+
+    # classical mds on the landmarks
+    landmark_D = landmark_rows[:, landmarks]
+    row_means = numpy.mean(landmark_D, axis=1, keepdims=True)
+    B = -0.5 * (landmark_D - row_means - row_means.T + numpy.mean(landmark_D))
+    eigen_values, eigen_vectors = top_eigenpairs(B, num_spatial_dims)
+    eigen_values = numpy.maximum(eigen_values, numpy.finfo(numpy.float64).eps)
+
+    # triangulate every point from its distances to the landmarks
+    pseudo_inverse = eigen_vectors / numpy.sqrt(eigen_values)
+    P = -0.5 * pseudo_inverse.T @ (landmark_rows - row_means)
+
     return P
 
 
+def smacof(
+    D: numpy.ndarray,
+    omega: numpy.ndarray,
+    num_spatial_dims: int = 2,
+    max_iterations: int = 300,
+    tolerance: float = 1e-5,
+    initial_P: Optional[numpy.ndarray] = None,
+):
+    """
+    Stress majorization (SMACOF) over the known pairs only, so missing
+    distances simply carry zero weight. Each iteration applies the Guttman
+    transform, solving the weighted laplacian system V X = B(X) X with
+    conjugate gradients. Memory and time per iteration are O(E) in the
+    number of known pairs
+
+    :param D: matrix of squared distances
+    :param omega: matrix with nonzero entries where the distance is known
+    :param num_spatial_dims: number of spatial dimensions
+    :param max_iterations: maximum number of Guttman transforms
+    :param tolerance: relative stress improvement below which to stop
+    :param initial_P: initial points with shape (num_spatial_dims, N)
+    :return: points P with shape (num_spatial_dims, N)
+    """
+    num_points = D.shape[0]
+    rows, columns = get_known_pairs(omega)
+    target_distances = numpy.sqrt(numpy.where(
+        omega[rows, columns] != 0,
+        D[rows, columns],
+        D[columns, rows]
+    ))
+
+    if initial_P is not None:
+        X = numpy.array(initial_P, dtype=numpy.float64).T
+    else:
+        scale = numpy.mean(target_distances) if len(target_distances) > 0 else 1.0
+        X = numpy.random.normal(scale=scale, size=(num_points, num_spatial_dims))
+
+    is_complete = len(rows) == num_points * (num_points - 1) // 2
+    if not is_complete:
+        weights = scipy.sparse.coo_matrix(
+            (numpy.ones(len(rows)), (rows, columns)),
+            shape=(num_points, num_points)
+        )
+        weights = weights + weights.T
+        V = scipy.sparse.diags(numpy.asarray(weights.sum(axis=1)).ravel()) - weights
+        V = V.tocsr()
+
+    prev_stress = numpy.inf
+    for _ in range(max_iterations):
+        differences = X[rows] - X[columns]
+        distances = numpy.linalg.norm(differences, axis=1)
+
+        stress = numpy.sum((distances - target_distances) ** 2)
+        if prev_stress - stress <= tolerance * prev_stress < numpy.inf:
+            break
+        prev_stress = stress
+
+        ratios = numpy.divide(
+            target_distances,
+            distances,
+            out=numpy.zeros_like(distances),
+            where=distances > 0.0
+        )
+        BX = numpy.empty_like(X)
+        for dim_i in range(num_spatial_dims):
+            edge_values = ratios * differences[:, dim_i]
+            BX[:, dim_i] = (
+                numpy.bincount(rows, edge_values, minlength=num_points)
+                - numpy.bincount(columns, edge_values, minlength=num_points)
+            )
+
+        if is_complete:
+            X = BX / num_points
+        else:
+            for dim_i in range(num_spatial_dims):
+                X[:, dim_i], _ = scipy.sparse.linalg.cg(V, BX[:, dim_i], x0=X[:, dim_i])
+
+    return X.T
+
+
+def solve_points(
+    D: numpy.ndarray,
+    omega: numpy.ndarray,
+    num_spatial_dims: int = 2,
+    margin: float = 0.0,
+    solver: Optional[str] = None,
+    max_sdp_points: int = 200,
+    max_dense_points: int = 5000,
+    timings: Optional[Dict[str, float]] = None,
+    dtype: numpy.dtype = numpy.float64,
+):
+    """
+    Chooses a solver based on problem size. Small problems are solved exactly
+    with the semidefinite program. Larger problems use classical MDS when the
+    distances are complete (landmark MDS above max_dense_points) and SMACOF
+    when they are not
+
+    :param D: matrix of squared distances
+    :param omega: matrix with nonzero entries where the distance is known
+    :param num_spatial_dims: number of spatial dimensions
+    :param margin: relative error allowed in each squared distance, only
+        used by the semidefinite program
+    :param solver: cvxpy solver name, only used by the semidefinite program
+    :param max_sdp_points: largest problem solved with the semidefinite program
+    :param max_dense_points: largest complete problem solved with classical MDS
+    :param timings: if given, filled with the timings of the semidefinite
+        program (see optimize_gram_matrix) or only the "total" of other solvers
+    :param dtype: dtype of the returned points
+    :return: points P with shape (num_spatial_dims, N)
+    """
+    num_points = D.shape[0]
+    if num_points <= max_sdp_points:
+        X = optimize_gram_matrix(D, omega, margin=margin, solver=solver, timings=timings)
+        if X is None: raise ValueError("Failed to optimize gram matrix")
+
+        return calculate_points(X, num_spatial_dims=num_spatial_dims, dtype=dtype)
+
+    start_time = time.perf_counter()
+    P = _solve_points_without_sdp(D, omega, num_spatial_dims, max_dense_points)
+    if timings is not None:
+        timings["total"] = time.perf_counter() - start_time
+
+    return P.astype(dtype, copy=False)
+
+
+def _solve_points_without_sdp(
+    D: numpy.ndarray,
+    omega: numpy.ndarray,
+    num_spatial_dims: int,
+    max_dense_points: int,
+):
+    num_points = D.shape[0]
+    if is_complete(omega):
+        if num_points <= max_dense_points:
+            return classical_mds(D, num_spatial_dims=num_spatial_dims)
+
+        return landmark_mds(D, num_spatial_dims=num_spatial_dims, omega=omega)
+
+    return smacof(D, omega, num_spatial_dims=num_spatial_dims)
+
+
 def visualize_points(P: numpy.ndarray, names: Optional[numpy.ndarray]):
+    import matplotlib.pyplot as plt
+
     figure = plt.figure(figsize = (5, 5))
     axis = plt.axes()
     
@@ -88,16 +421,20 @@ def visualize_points(P: numpy.ndarray, names: Optional[numpy.ndarray]):
 
 if __name__ == "__main__":
     dataset_path = sys.argv[1]
-    D = read_d_from_dist_csv(os.path.join(dataset_path, "dist.csv"))
-    omega = read_omega_from_csv(os.path.join(dataset_path, "omega.csv"), sparsity=0.0)
-    names = read_names_from_csv(os.path.join(dataset_path, "names.csv"))
+    if os.path.exists(os.path.join(dataset_path, DIST_FILE_NAME)):
+        # converted with dataset.py, memory mapped rather than read into RAM
+        _, omega, names = load_dataset(dataset_path)
+        D = load_d(dataset_path)
+    else:
+        D = read_d_from_dist_csv(os.path.join(dataset_path, "dist.csv"))
+        omega = read_omega_from_csv(os.path.join(dataset_path, "omega.csv"), sparsity=0.0)
+        names = read_names_from_csv(os.path.join(dataset_path, "names.csv"))
     
-    # find gram matrix
-    X = optimize_gram_matrix(D, omega, margin=0.05)  # 0.05 for mass, 0.78 for tufts
-    if X is None: raise ValueError("Failed to optimize gram matrix")
-
-    # find points from gram matrix
-    P = calculate_points(X, num_spatial_dims=2)
+    # find points, small problems are solved via the gram matrix
+    solver = sys.argv[2] if len(sys.argv) > 2 else None
+    timings = {}
+    P = solve_points(D, omega, num_spatial_dims=2, margin=0.05, solver=solver, timings=timings)  # 0.05 for mass, 0.78 for tufts
+    print(", ".join(f"{name}: {seconds:0.3f}s" for name, seconds in timings.items() if seconds is not None))
 
     # visualize points
     visualize_points(P, names)
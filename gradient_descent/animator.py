@@ -1,14 +1,24 @@
 from typing import List
 
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation, PillowWriter
+import numpy
 
 from models import Point
+from snapshot import SnapshotBuffer
 
 class Animator():
     def __init__(self, points: List[Point], expected_range: int = 0.5):
+        """
+        Matplotlib is only imported once an animator is created, so headless
+        runs never load it
+
+        :param points: points to animate
+        :param expected_range: half width of the plotted area
+        """
+        import matplotlib.pyplot as plt
+
         self._points = points
         self._expected_range = expected_range
+        self._snapshots = None
 
         self._fig, self._ax = plt.subplots()
 
@@ -26,7 +36,9 @@ class Animator():
         return (self._ax, self.scatter_plot)
 
     def _animate(self, _frame_i: int):
-        offsets = [point.position for point in self._points]
+        offsets = self._snapshots.read() if self._snapshots else None
+        if offsets is None:
+            offsets = [point.position for point in self._points]
         self.scatter_plot.set_offsets(offsets)
 
         for text, offset in zip(self._texts, offsets):
@@ -42,7 +54,22 @@ class Animator():
     def points(self, points: List[Point]):
         self._points = points
 
+    def publish(self, positions: numpy.ndarray):
+        """
+        Called from the optimizer thread, copies positions into a double
+        buffer which is read by the animation without blocking the optimizer
+
+        :param positions: (N, D) array of positions
+        """
+        if self._snapshots is None:
+            self._snapshots = SnapshotBuffer(positions.shape, positions.dtype)
+
+        self._snapshots.publish(positions)
+
     def show_animation(self):
+        import matplotlib.pyplot as plt
+        from matplotlib.animation import FuncAnimation, PillowWriter
+
         animation = FuncAnimation(
             self._fig,
             self._animate,
@@ -0,0 +1,251 @@
+from typing import List, Optional, Tuple
+
+import numpy
+
+from models import Point
+
+class BatchResult():
+    def __init__(
+        self,
+        positions: numpy.ndarray,
+        losses: numpy.ndarray,
+        steps: numpy.ndarray,
+        stop_reasons: List[str],
+    ):
+        """
+        :param positions: (B, N, D) optimized positions
+        :param losses: (B, ) final total loss of each problem
+        :param steps: (B, ) steps taken by each problem
+        :param stop_reasons: why each problem stopped, "converged",
+            "minimum_loss" or "max_steps"
+        """
+        self.positions = positions
+        self.losses = losses
+        self.steps = steps
+        self.stop_reasons = stop_reasons
+
+def stack_problems(point_sets: List[List[Point]]) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Pads problems with different numbers of points to a common size. Padded
+    rows and columns are nan, so padded points have no targets and never move
+
+    :param point_sets: one list of points with dense target_distances per problem
+    :return: (B, N, N) target distances with nan where unknown, and the
+        number of points in each problem
+    """
+    num_points = numpy.array([len(points) for points in point_sets])
+    target_distances = numpy.full((len(point_sets), numpy.max(num_points), numpy.max(num_points)), numpy.nan)
+    for problem_i, points in enumerate(point_sets):
+        target_distances[problem_i, :len(points), :len(points)] = numpy.array(
+            [point.target_distances for point in points],
+            dtype=numpy.float64
+        ).reshape(len(points), len(points))
+
+    return target_distances, num_points
+
+def calc_batched_losses_and_gradients(
+    positions: numpy.ndarray,
+    target_distances: numpy.ndarray,
+    target_mask: numpy.ndarray,
+    target_counts: numpy.ndarray,
+    num_points: numpy.ndarray,
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    The same loss and gradients as MSELoss, for every problem at once
+
+    :param positions: (B, N, D) positions
+    :param target_distances: (B, N, N) target distances, 0 where unknown
+    :param target_mask: (B, N, N) True where the target distance is known
+    :param target_counts: (B, N) number of known targets of each point
+    :param num_points: (B, ) number of points in each problem
+    :return: (B, ) total losses and (B, N, D) gradients
+    """
+    squared_distances = numpy.zeros(target_distances.shape, dtype=positions.dtype)
+    for dim_i in range(positions.shape[2]):
+        squared_distances += (
+            positions[:, :, numpy.newaxis, dim_i] - positions[:, numpy.newaxis, :, dim_i]
+        ) ** 2
+    distances = numpy.sqrt(squared_distances)
+
+    residuals = numpy.where(target_mask, distances - target_distances, 0.0)
+    safe_counts = numpy.maximum(target_counts, 1).astype(positions.dtype)
+    point_losses = numpy.sum(residuals ** 2, axis=2) / safe_counts
+    total_losses = numpy.sum(point_losses, axis=1) / num_points
+
+    weights = numpy.divide(
+        residuals,
+        distances,
+        out=numpy.zeros_like(residuals),
+        where=distances > 0.0
+    )
+    gradients = (
+        positions * numpy.sum(weights, axis=2, keepdims=True)
+        - weights @ positions
+    ) / safe_counts[:, :, numpy.newaxis]
+
+    return total_losses, gradients
+
+def optimize_batched(
+    target_distances: numpy.ndarray,
+    num_points: Optional[numpy.ndarray] = None,
+    positions: Optional[numpy.ndarray] = None,
+    num_dims: int = 2,
+    expected_range: float = 1.0,
+    learning_rate: float = 0.03,
+    momentum: float = 0.9,
+    max_steps: int = 5000,
+    minimum_loss: float = 0.0,
+    relative_tolerance: float = 1e-4,
+    window_steps: int = 100,
+    patience: int = 3,
+    dtype: numpy.dtype = numpy.float64,
+) -> BatchResult:
+    """
+    Optimizes a batch of independent problems with full-batch gradient
+    descent with momentum. Every step updates all active problems with a
+    few batched numpy operations instead of one Python loop per problem.
+    Each problem has its own convergence tracking as in ConvergenceMonitor
+    and is dropped from the batch as soon as it stops
+
+    :param target_distances: (B, N, N) target distances, nan where unknown
+        or padded
+    :param num_points: (B, ) number of real points in each problem, used to
+        average losses, defaults to N
+    :param positions: (B, N, D) initial positions, defaults to random normal
+    :param num_dims: number of spatial dimensions of random positions
+    :param expected_range: scale of random positions
+    :param learning_rate: step size
+    :param momentum: momentum of each point's previous change
+    :param max_steps: maximum steps per problem
+    :param minimum_loss: problems stop once their loss is at most this
+    :param relative_tolerance: minimum relative improvement per window, 0
+        disables convergence detection
+    :param window_steps: steps per window
+    :param patience: consecutive windows without enough improvement before
+        a problem stops
+    :param dtype: dtype of positions, targets and gradients
+    :return: batch result with positions, losses, steps and stop reasons
+    """
+    num_problems, max_points, _ = target_distances.shape
+    if num_points is None:
+        num_points = numpy.full(num_problems, max_points)
+    if positions is None:
+        positions = numpy.random.normal(scale=expected_range, size=(num_problems, max_points, num_dims))
+
+    target_mask = ~numpy.isnan(target_distances)
+    filled_target_distances = numpy.nan_to_num(target_distances).astype(dtype)
+    target_counts = numpy.count_nonzero(target_mask, axis=2)
+
+    result = BatchResult(
+        positions=numpy.array(positions, dtype=dtype),
+        losses=numpy.full(num_problems, numpy.inf),
+        steps=numpy.zeros(num_problems, dtype=int),
+        stop_reasons=["max_steps"] * num_problems,
+    )
+
+    # working arrays only hold the active problems, and are compacted when
+    # problems stop rather than indexed every step
+    active = numpy.arange(num_problems)
+    active_positions = result.positions.copy()
+    active_target_distances = filled_target_distances
+    active_target_mask = target_mask
+    active_target_counts = target_counts
+    active_num_points = num_points
+    prev_changes = numpy.zeros_like(active_positions)
+    window_start_losses = numpy.zeros(num_problems)
+    num_stalled_windows = numpy.zeros(num_problems, dtype=int)
+
+    for step_i in range(max_steps + 1):
+        losses, gradients = calc_batched_losses_and_gradients(
+            active_positions,
+            active_target_distances,
+            active_target_mask,
+            active_target_counts,
+            active_num_points,
+        )
+        result.losses[active] = losses
+        result.steps[active] = step_i
+
+        is_stopped = losses <= minimum_loss
+        for problem_i in active[is_stopped]:
+            result.stop_reasons[problem_i] = "minimum_loss"
+
+        if relative_tolerance > 0.0 and step_i % window_steps == 0:
+            if step_i > 0:
+                improvements = (
+                    (window_start_losses - losses)
+                    / numpy.maximum(numpy.abs(window_start_losses), numpy.finfo(float).tiny)
+                )
+                is_stalled = improvements < relative_tolerance
+                num_stalled_windows = numpy.where(is_stalled, num_stalled_windows + 1, 0)
+                is_converged = (num_stalled_windows >= patience) & ~is_stopped
+                for problem_i in active[is_converged]:
+                    result.stop_reasons[problem_i] = "converged"
+
+                is_stopped |= is_converged
+
+            window_start_losses = losses.copy()
+
+        if step_i == max_steps:
+            is_stopped[:] = True
+
+        if numpy.any(is_stopped):
+            result.positions[active[is_stopped]] = active_positions[is_stopped]
+
+            is_kept = ~is_stopped
+            active = active[is_kept]
+            if len(active) == 0: break
+
+            active_positions = active_positions[is_kept]
+            active_target_distances = active_target_distances[is_kept]
+            active_target_mask = active_target_mask[is_kept]
+            active_target_counts = active_target_counts[is_kept]
+            active_num_points = active_num_points[is_kept]
+            prev_changes = prev_changes[is_kept]
+            gradients = gradients[is_kept]
+            window_start_losses = window_start_losses[is_kept]
+            num_stalled_windows = num_stalled_windows[is_kept]
+
+        changes = gradients * learning_rate + momentum * prev_changes
+        active_positions -= changes
+        prev_changes = changes
+
+    return result
+
+def optimize_point_sets(
+    point_sets: List[List[Point]],
+    max_batch_size: int = 256,
+    **kwargs,
+) -> List[BatchResult]:
+    """
+    Sorts point sets by size and optimizes batches of similar sizes with
+    optimize_batched, so that little work is spent on padding. Each point's
+    position is set to its optimized position
+
+    :param point_sets: one list of points with dense target_distances per problem
+    :param max_batch_size: maximum number of problems per batch
+    :param kwargs: keyword arguments passed to optimize_batched
+    :return: result of each point set, with the batch dimension removed
+    """
+    order = numpy.argsort([len(points) for points in point_sets], kind="stable")
+    results = [None] * len(point_sets)
+
+    for batch_start in range(0, len(order), max_batch_size):
+        batch_indices = order[batch_start: batch_start + max_batch_size]
+        batch_point_sets = [point_sets[index] for index in batch_indices]
+
+        target_distances, num_points = stack_problems(batch_point_sets)
+        result = optimize_batched(target_distances, num_points=num_points, **kwargs)
+
+        for problem_i, (index, points) in enumerate(zip(batch_indices, batch_point_sets)):
+            for point, position in zip(points, result.positions[problem_i]):
+                point.position = position
+
+            results[index] = BatchResult(
+                positions=result.positions[problem_i, :len(points)],
+                losses=result.losses[problem_i],
+                steps=result.steps[problem_i],
+                stop_reasons=result.stop_reasons[problem_i],
+            )
+
+    return results
@@ -0,0 +1,258 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import os
+os.environ.setdefault("MPLBACKEND", "Agg")  # never open windows
+
+import csv
+import json
+import time
+import argparse
+import itertools
+import tracemalloc
+import numpy
+
+from main import optimize_points
+from multilevel import optimize_multilevel
+from models import Point, Graph
+from callback import Callback
+from helpers import import_convex_optimization
+
+parser = argparse.ArgumentParser(description="Run a headless benchmark sweep")
+parser.add_argument("--num_points", type=int, nargs="+", default=[20, 50, 100])
+parser.add_argument("--num_dims", type=int, nargs="+", default=[2])
+parser.add_argument("--densities", type=float, nargs="+", default=[1.0, 0.5])
+parser.add_argument("--noises", type=float, nargs="+", default=[0.0, 0.05])
+parser.add_argument("--neighbors", type=int, default=None)
+parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+parser.add_argument(
+    "--solvers",
+    nargs="+",
+    choices=["gradient", "multilevel", "convex"],
+    default=["gradient", "multilevel", "convex"]
+)
+parser.add_argument("--max_convex_points", type=int, default=100)
+parser.add_argument("--margin", type=float, default=None)
+parser.add_argument("--expected_range", type=float, default=100.0)
+parser.add_argument("--max_steps", type=int, default=5000)
+parser.add_argument("--learning_rate", type=float, default=0.1)
+parser.add_argument("--momentum", type=float, default=0.5)
+parser.add_argument("--batch_size", type=int, default=0)
+parser.add_argument("--optimizer", dest="optimizer_name", default="sgd")
+parser.add_argument("--skip_memory", action="store_true")
+parser.add_argument("--out_path", type=str, default="benchmark_results")
+
+def generate_problem(
+    num_points: int,
+    num_dims: int,
+    density: float,
+    noise: float,
+    expected_range: float,
+    seed: int,
+    num_neighbors: Optional[int] = None,
+) -> Tuple[numpy.ndarray, Graph]:
+    """
+    :param num_points: number of points
+    :param num_dims: number of spatial dimensions
+    :param density: fraction of pairs whose distance is known, ignored if
+        num_neighbors is set
+    :param noise: standard deviation of the multiplicative noise applied to
+        each known distance
+    :param expected_range: points are drawn uniformly from
+        [-expected_range, expected_range] in each dimension
+    :param seed: seed of the problem
+    :param num_neighbors: if set, only the distances from each point to its
+        num_neighbors nearest points are known, as in sensor networks
+    :return: true positions and graph of noisy known distances
+    """
+    random_state = numpy.random.default_rng(seed)
+    true_positions = random_state.uniform(-expected_range, expected_range, size=(num_points, num_dims))
+
+    sources, targets = numpy.triu_indices(num_points, k=1)
+    if num_neighbors is None:
+        is_known = random_state.random(len(sources)) < density
+    else:
+        true_distances = numpy.linalg.norm(true_positions[:, numpy.newaxis] - true_positions, axis=2)
+        numpy.fill_diagonal(true_distances, numpy.inf)
+        neighbors = numpy.argsort(true_distances, axis=1)[:, :num_neighbors]
+        is_neighbor = numpy.zeros((num_points, num_points), dtype=bool)
+        is_neighbor[numpy.arange(num_points)[:, numpy.newaxis], neighbors] = True
+        is_known = (is_neighbor | is_neighbor.T)[sources, targets]
+    sources, targets = sources[is_known], targets[is_known]
+
+    distances = numpy.linalg.norm(true_positions[sources] - true_positions[targets], axis=1)
+    distances *= 1 + noise * random_state.standard_normal(len(distances))
+
+    return true_positions, Graph(num_points, sources, targets, numpy.abs(distances))
+
+def normalized_stress(positions: numpy.ndarray, graph: Graph) -> float:
+    """
+    :return: sqrt(sum((d - t) ^ 2) / sum(t ^ 2)) over the known pairs
+    """
+    distances = numpy.linalg.norm(positions[graph.sources] - positions[graph.targets], axis=1)
+    return float(numpy.sqrt(
+        numpy.sum((distances - graph.distances) ** 2) / numpy.sum(graph.distances ** 2)
+    ))
+
+def procrustes_error(positions: numpy.ndarray, true_positions: numpy.ndarray) -> float:
+    """
+    Aligns positions to true_positions with the best translation, rotation
+    and reflection, since distances alone cannot determine them
+
+    :return: root mean squared distance between aligned and true positions
+    """
+    positions = positions - numpy.mean(positions, axis=0)
+    true_positions = true_positions - numpy.mean(true_positions, axis=0)
+
+    u, _, vt = numpy.linalg.svd(positions.T @ true_positions)
+    aligned_positions = positions @ (u @ vt)
+
+    return float(numpy.sqrt(numpy.mean(numpy.sum((aligned_positions - true_positions) ** 2, axis=1))))
+
+def run_gradient(
+    graph: Graph,
+    num_dims: int,
+    args: argparse.Namespace,
+    multilevel: bool = False,
+) -> Tuple[numpy.ndarray, int]:
+    positions = numpy.random.normal(scale=args.expected_range, size=(graph.num_points, num_dims))
+    points = [Point(position=position.tolist()) for position in positions]
+
+    callback = Callback(verbose=False, every_steps=None, max_losses=args.max_steps + 1)
+    optimize_kwargs = {
+        "learning_rate": args.learning_rate,
+        "momentum": args.momentum,
+        "max_steps": args.max_steps,
+        "batch_size": args.batch_size,
+        "optimizer_name": args.optimizer_name,
+        "initial_temperature": 1.0,
+        "change_temperature": 0.0,
+        "callback": callback,
+    }
+    if multilevel:
+        optimize_multilevel(points, graph, num_dims=num_dims, expected_range=args.expected_range, **optimize_kwargs)
+    else:
+        optimize_points(points, graph=graph, **optimize_kwargs)
+
+    # steps of the finest level
+    return numpy.array([point.position for point in points]), len(callback.losses)
+
+def run_convex(graph: Graph, num_dims: int, noise: float, args: argparse.Namespace) -> Tuple[numpy.ndarray, int]:
+    optimize = import_convex_optimization()
+
+    D, omega = graph.to_dense()
+
+    # squared distances with multiplicative noise n have relative error ~2n
+    margin = args.margin if args.margin is not None else 4 * noise
+    X = optimize.optimize_gram_matrix(D, omega, margin=margin)
+    if X is None: raise ValueError("Failed to optimize gram matrix")
+
+    return optimize.calculate_points(X, num_spatial_dims=num_dims).T, 1
+
+def solve_problem(
+    solver: str,
+    graph: Graph,
+    num_dims: int,
+    noise: float,
+    seed: int,
+    args: argparse.Namespace,
+) -> Tuple[numpy.ndarray, int]:
+    """
+    :return: positions found by solver and the number of steps taken, the
+        same for every call with the same arguments
+    """
+    numpy.random.seed(seed)
+    if solver in ("gradient", "multilevel"):
+        return run_gradient(graph, num_dims, args, multilevel=solver == "multilevel")
+
+    return run_convex(graph, num_dims, noise, args)
+
+def run_benchmark(
+    solver: str,
+    num_points: int,
+    num_dims: int,
+    density: float,
+    noise: float,
+    seed: int,
+    args: argparse.Namespace,
+) -> Dict[str, Any]:
+    """
+    :return: record of the problem settings and the solver's wall time,
+        steps, peak traced memory, normalized stress and procrustes error.
+        Failed or skipped runs record an error instead. Peak memory is
+        measured in a second, untimed run unless args.skip_memory is set
+    """
+    record = {
+        "solver": solver,
+        "num_points": num_points,
+        "num_dims": num_dims,
+        "density": density,
+        "neighbors": args.neighbors,
+        "noise": noise,
+        "seed": seed,
+    }
+
+    true_positions, graph = generate_problem(
+        num_points, num_dims, density, noise, args.expected_range, seed, args.neighbors
+    )
+
+    # import outside of the timed region
+    if solver == "convex":
+        try:
+            import_convex_optimization()
+        except ImportError as error:
+            record["error"] = str(error)
+            return record
+
+    # tracing slows allocations severalfold, so peak memory is measured by
+    # repeating the run under tracemalloc rather than in the timed run
+    try:
+        start_time = time.perf_counter()
+        positions, steps = solve_problem(solver, graph, num_dims, noise, seed, args)
+        record["wall_time"] = time.perf_counter() - start_time
+
+        if not args.skip_memory:
+            tracemalloc.start()
+            try:
+                solve_problem(solver, graph, num_dims, noise, seed, args)
+                record["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    except ValueError as error:
+        record["error"] = str(error)
+        return record
+
+    record["steps"] = steps
+    record["stress"] = normalized_stress(positions, graph)
+    record["procrustes_error"] = procrustes_error(positions, true_positions)
+
+    return record
+
+def write_results(records: List[Dict[str, Any]], out_path: str):
+    """
+    Writes records to out_path.json and out_path.csv
+    """
+    with open(f"{out_path}.json", "w") as json_file:
+        json.dump(records, json_file, indent=2)
+
+    field_names = list(dict.fromkeys(key for record in records for key in record))
+    with open(f"{out_path}.csv", "w", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=field_names)
+        writer.writeheader()
+        writer.writerows(records)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    records = []
+    sweep = itertools.product(
+        args.solvers, args.num_points, args.num_dims, args.densities, args.noises, args.seeds
+    )
+    for solver, num_points, num_dims, density, noise, seed in sweep:
+        if solver == "convex" and num_points > args.max_convex_points:
+            continue
+
+        record = run_benchmark(solver, num_points, num_dims, density, noise, seed, args)
+        records.append(record)
+        print(", ".join(f"{key}: {value}" for key, value in record.items()))
+
+    write_results(records, args.out_path)
@@ -1,35 +1,105 @@
 from typing import List, Optional
 
+import time
+import numpy
+
 from models import Point
 from animator import Animator
+from recording import PositionRecorder
 
 class Callback():
     def __init__(
         self,
         animator: Optional[Animator] = None,
         verbose: bool = False,
+        every_steps: Optional[int] = 1,
+        every_seconds: Optional[float] = None,
+        max_losses: int = 100000,
+        recorder: Optional[PositionRecorder] = None,
     ):
+        """
+        Records the total loss of every step and, at most every every_steps
+        steps or every_seconds seconds, prints progress and publishes a
+        snapshot of the positions to the animator
+
+        :param animator: optional animator to publish positions to
+        :param verbose: print progress when reporting
+        :param every_steps: report every this many steps, None to disable
+        :param every_seconds: report once this many seconds have passed since
+            the last report, None to disable
+        :param max_losses: capacity of the loss ring buffer. Only the most
+            recent max_losses losses are kept
+        :param recorder: optional recorder of position snapshots, which
+            records at its own stride regardless of reporting
+        """
         self._animator = animator
         self._verbose = verbose
-        self.losses = []
+        self._every_steps = every_steps
+        self._every_seconds = every_seconds
+        self.recorder = recorder
+
+        self._losses = numpy.zeros(max_losses)
+        self._num_losses = 0
+        self._last_report_time = time.perf_counter()
+
+    @property
+    def losses(self) -> numpy.ndarray:
+        """
+        :return: recorded losses in chronological order
+        """
+        capacity = len(self._losses)
+        if self._num_losses <= capacity:
+            return self._losses[:self._num_losses].copy()
+
+        start = self._num_losses % capacity
+        return numpy.concatenate([self._losses[start:], self._losses[:start]])
+
+    def restore_losses(self, losses: numpy.ndarray):
+        """
+        :param losses: loss history to continue from, such as from a checkpoint
+        """
+        losses = losses[-len(self._losses):]
+        self._losses[:len(losses)] = losses
+        self._num_losses = len(losses)
 
+    def should_report(self, steps: int) -> bool:
+        if self._every_steps and steps % self._every_steps == 0:
+            return True
+
+        return (
+            self._every_seconds is not None
+            and time.perf_counter() - self._last_report_time >= self._every_seconds
+        )
 
     def __call__(
         self,
         steps: int,
         points: List[Point],
-        point: Point,
+        point: Optional[Point],
         point_loss: float,
         total_loss: float,
         temperature: float,
+        positions: Optional[numpy.ndarray] = None,
     ):
+        self._losses[self._num_losses % len(self._losses)] = total_loss
+        self._num_losses += 1
+
+        if self.recorder is not None and positions is not None:
+            self.recorder.record(steps, positions, total_loss)
+
+        if not self.should_report(steps):
+            return
+        self._last_report_time = time.perf_counter()
+
         if self._verbose:
             print(
                 f"steps: {steps} | total_loss: {total_loss:0.4f} | "
-                f"temp: {temperature:0.1f} | point: {point}"
+                f"temp: {temperature:0.1f}"
+                + (f" | point: {point}" if point else "")
             )
 
         if self._animator:
-            self._animator.points = points
-
-        self.losses.append(total_loss)
+            if positions is not None:
+                self._animator.publish(positions)
+            else:
+                self._animator.points = points
@@ -0,0 +1,102 @@
+from typing import Any, Dict, Optional
+
+import os
+import numpy
+
+from optimizer import Optimizer
+from sampler import TemperatureSampler
+from convergence import ConvergenceMonitor
+
+OPTIMIZER_PREFIX = "optimizer/"
+SAMPLER_PREFIX = "sampler/"
+MONITOR_PREFIX = "monitor/"
+
+def save_checkpoint(
+    checkpoint_path: str,
+    positions: numpy.ndarray,
+    optimizer: Optimizer,
+    temperature: float,
+    losses: Optional[numpy.ndarray] = None,
+    sampler: Optional[TemperatureSampler] = None,
+    monitor: Optional[ConvergenceMonitor] = None,
+):
+    """
+    Saves the run state to a .npz file. The file is written next to
+    checkpoint_path and then renamed over it, so an interrupted save never
+    corrupts the previous checkpoint
+
+    :param checkpoint_path: path of the .npz checkpoint
+    :param positions: (N, D) positions array
+    :param optimizer: optimizer whose state_dict is saved
+    :param temperature: current sampling temperature
+    :param losses: loss history
+    :param sampler: sampler whose state_dict is saved
+    :param monitor: convergence monitor whose state_dict is saved, including
+        its stop reason
+    """
+    algorithm, keys, position, has_gauss, cached_gaussian = numpy.random.get_state()
+    arrays = {
+        "positions": positions,
+        "temperature": numpy.array(temperature),
+        "losses": losses if losses is not None else numpy.zeros(0),
+        "random_algorithm": numpy.array(algorithm),
+        "random_keys": keys,
+        "random_position": numpy.array(position),
+        "random_has_gauss": numpy.array(has_gauss),
+        "random_cached_gaussian": numpy.array(cached_gaussian),
+    }
+    arrays.update({
+        OPTIMIZER_PREFIX + name: value
+        for name, value in optimizer.state_dict().items()
+    })
+    if sampler is not None:
+        arrays.update({
+            SAMPLER_PREFIX + name: value
+            for name, value in sampler.state_dict().items()
+        })
+    if monitor is not None:
+        arrays.update({
+            MONITOR_PREFIX + name: value
+            for name, value in monitor.state_dict().items()
+        })
+
+    temporary_path = checkpoint_path + ".tmp"
+    with open(temporary_path, "wb") as checkpoint_file:
+        numpy.savez(checkpoint_file, **arrays)
+    os.replace(temporary_path, checkpoint_path)
+
+def load_checkpoint(checkpoint_path: str) -> Dict[str, Any]:
+    """
+    :param checkpoint_path: path of a checkpoint written by save_checkpoint
+    :return: dictionary of positions, temperature, losses, random_state,
+        optimizer state_dict, and sampler and monitor state_dicts, which are
+        empty if they were not saved
+    """
+    with numpy.load(checkpoint_path) as arrays:
+        return {
+            "positions": arrays["positions"],
+            "temperature": float(arrays["temperature"]),
+            "losses": arrays["losses"],
+            "random_state": (
+                str(arrays["random_algorithm"]),
+                arrays["random_keys"],
+                int(arrays["random_position"]),
+                int(arrays["random_has_gauss"]),
+                float(arrays["random_cached_gaussian"]),
+            ),
+            "optimizer": {
+                name[len(OPTIMIZER_PREFIX):]: arrays[name]
+                for name in arrays.files
+                if name.startswith(OPTIMIZER_PREFIX)
+            },
+            "sampler": {
+                name[len(SAMPLER_PREFIX):]: arrays[name]
+                for name in arrays.files
+                if name.startswith(SAMPLER_PREFIX)
+            },
+            "monitor": {
+                name[len(MONITOR_PREFIX):]: arrays[name]
+                for name in arrays.files
+                if name.startswith(MONITOR_PREFIX)
+            },
+        }
@@ -0,0 +1,157 @@
+from typing import Dict
+
+import numpy
+
+class ConvergenceMonitor():
+    # stop reasons decided by the monitor itself, any other stop reason
+    # depends on the caller's max_steps or minimum_loss
+    STOP_REASONS = ("converged", "gradient_norm")
+
+    def __init__(
+        self,
+        relative_tolerance: float = 0.0,
+        window_steps: int = 1000,
+        patience: int = 1,
+        gradient_tolerance: float = 0.0,
+    ):
+        """
+        Decides when optimization has converged using statistics which are
+        updated in O(1) per step, or O(batch size) for the gradient norm
+
+        Every window_steps steps, the relative improvement of the total loss
+        since the previous window is compared against relative_tolerance.
+        Optimization stops after patience consecutive windows below it.
+        Optimization also stops once the root mean square of each point's
+        most recent gradient norm falls below gradient_tolerance
+
+        :param relative_tolerance: minimum relative improvement per window,
+            0 disables this criterion
+        :param window_steps: steps per window
+        :param patience: consecutive windows without enough improvement
+            before stopping
+        :param gradient_tolerance: root mean square gradient norm below which
+            optimization stops, 0 disables this criterion
+        """
+        self._relative_tolerance = relative_tolerance
+        self._window_steps = window_steps
+        self._patience = patience
+        self._gradient_tolerance = gradient_tolerance
+
+        self.reset()
+
+    def reset(self, num_points: int = 0):
+        """
+        :param num_points: number of points whose gradients are tracked
+        """
+        self.stop_reason = None
+        self._window_start_loss = None
+        self._num_stalled_windows = 0
+
+        self._squared_gradient_norms = numpy.zeros(num_points)
+        self._squared_gradient_norm_sum = 0.0
+        self._has_gradient = numpy.zeros(num_points, dtype=bool)
+        self._num_with_gradient = 0
+
+    @property
+    def gradient_norm(self) -> float:
+        """
+        :return: root mean square of each point's most recent gradient norm,
+            inf until every point has had a gradient
+        """
+        if self._num_with_gradient < len(self._has_gradient) or self._num_with_gradient == 0:
+            return numpy.inf
+
+        return float(numpy.sqrt(max(self._squared_gradient_norm_sum, 0.0) / self._num_with_gradient))
+
+    def update(
+        self,
+        steps: int,
+        total_loss: float,
+        indices: numpy.ndarray,
+        gradients: numpy.ndarray,
+    ) -> bool:
+        """
+        :param steps: total steps taken
+        :param total_loss: total loss after the step
+        :param indices: indices of the points which were stepped
+        :param gradients: gradients of the points which were stepped
+        :return: True if optimization should stop, stop_reason is then set
+        """
+        if self._gradient_tolerance > 0.0:
+            self._update_gradient_norms(steps, indices, gradients)
+            if self.gradient_norm < self._gradient_tolerance:
+                self.stop_reason = "gradient_norm"
+                return True
+
+        if self._relative_tolerance > 0.0 and steps % self._window_steps == 0:
+            if self._window_start_loss is not None:
+                improvement = (
+                    (self._window_start_loss - total_loss)
+                    / max(abs(self._window_start_loss), numpy.finfo(float).tiny)
+                )
+                if improvement < self._relative_tolerance:
+                    self._num_stalled_windows += 1
+                else:
+                    self._num_stalled_windows = 0
+
+                if self._num_stalled_windows >= self._patience:
+                    self.stop_reason = "converged"
+                    return True
+
+            self._window_start_loss = total_loss
+
+        return False
+
+    def state_dict(self) -> Dict[str, numpy.ndarray]:
+        """
+        :return: arrays needed to continue monitoring exactly
+        """
+        return {
+            "stop_reason": numpy.array(self.stop_reason or ""),
+            "window_start_loss": numpy.array(
+                self._window_start_loss if self._window_start_loss is not None else numpy.nan
+            ),
+            "num_stalled_windows": numpy.array(self._num_stalled_windows),
+            "squared_gradient_norms": self._squared_gradient_norms,
+            "squared_gradient_norm_sum": numpy.array(self._squared_gradient_norm_sum),
+            "has_gradient": self._has_gradient,
+        }
+
+    def load_state_dict(self, state_dict: Dict[str, numpy.ndarray]):
+        """
+        Only stop reasons in STOP_REASONS are restored, since max_steps and
+        minimum_loss may change between runs
+
+        :param state_dict: arrays returned by state_dict
+        """
+        stop_reason = str(state_dict["stop_reason"])
+        self.stop_reason = stop_reason if stop_reason in self.STOP_REASONS else None
+
+        window_start_loss = float(state_dict["window_start_loss"])
+        self._window_start_loss = None if numpy.isnan(window_start_loss) else window_start_loss
+        self._num_stalled_windows = int(state_dict["num_stalled_windows"])
+
+        self._squared_gradient_norms = numpy.array(state_dict["squared_gradient_norms"], dtype=numpy.float64)
+        self._squared_gradient_norm_sum = float(state_dict["squared_gradient_norm_sum"])
+        self._has_gradient = numpy.array(state_dict["has_gradient"], dtype=bool)
+        self._num_with_gradient = int(numpy.count_nonzero(self._has_gradient))
+
+    def _update_gradient_norms(self, steps: int, indices: numpy.ndarray, gradients: numpy.ndarray):
+        squared_norms = numpy.sum(gradients ** 2, axis=1)
+
+        if len(indices) == len(self._squared_gradient_norms):
+            self._squared_gradient_norms[indices] = squared_norms
+            self._squared_gradient_norm_sum = float(numpy.sum(squared_norms))
+            self._has_gradient[:] = True
+            self._num_with_gradient = len(indices)
+            return
+
+        # indices are unique, so the running sum can be updated in place
+        self._squared_gradient_norm_sum += float(numpy.sum(squared_norms - self._squared_gradient_norms[indices]))
+        self._squared_gradient_norms[indices] = squared_norms
+        self._num_with_gradient += int(numpy.count_nonzero(~self._has_gradient[indices]))
+        self._has_gradient[indices] = True
+
+        # resum occasionally so rounding errors cannot accumulate
+        if steps % self._window_steps == 0:
+            self._squared_gradient_norm_sum = float(numpy.sum(self._squared_gradient_norms))
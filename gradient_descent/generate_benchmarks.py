@@ -1,36 +1,47 @@
-from typing import List, Tuple
+from typing import List
+
+import os
+os.environ.setdefault("MPLBACKEND", "Agg")  # never open windows
 
 import argparse
 import numpy
-import threading
 
-from main import optimize_points
-from models import Point
-from animator import Animator
-from callback import Callback
-from helpers import (
-    initialize_point_positions,
-    validate_points,
-    plot_points,
-    plot_loss
+from main import (
+    add_optimize_arguments,
+    spawn_seeds,
+    run_restarts,
+    validate_arguments,
 )
+from models import Point
+from solve import run_sequential_restarts, summarize_results, write_summary
+from benchmark import procrustes_error
+from helpers import plot_points, plot_loss
 
-parser = argparse.ArgumentParser(description='Process some integers.')
+parser = argparse.ArgumentParser(description="Optimize randomly generated points without plotting or animating")
 parser.add_argument("num_points", type=int)
-parser.add_argument("--minimum_loss", type=float, default=0.01)
-parser.add_argument("--max_steps", type=int, default=30000)
-parser.add_argument("--learning_rate", type=float, default=0.07)
-parser.add_argument("--momentum", type=float, default=0.99)
-parser.add_argument("--initial_temperature", type=float, default=1000.0)
-parser.add_argument("--change_temperature", type=float, default=-0.08)
-parser.add_argument("--expected_range", type=float, default=500)
-parser.add_argument('--verbose', dest='verbose', action='store_true')
-parser.add_argument('--silent', dest='verbose', action='store_false')
-parser.add_argument('--animate', dest='animate', action='store_true')
-parser.add_argument('--no_animate', dest='animate', action='store_false')
-parser.set_defaults(verbose=True, animate=True)
+add_optimize_arguments(parser)
+parser.add_argument("--out_path", type=str, default=None)
+parser.add_argument("--plot_dir", type=str, default=None)
+parser.set_defaults(
+    seed=0,
+    minimum_loss=0.01,
+    learning_rate=0.07,
+    initial_temperature=1000.0,
+    change_temperature=-0.08,
+)
 
-def points_from_positions(point_positions: List[Tuple[float, float]]):
+def generate_positions(num_points: int, expected_range: float, seed: int) -> numpy.ndarray:
+    """
+    :param num_points: number of points
+    :param expected_range: points are drawn uniformly from
+        [-expected_range, expected_range] in each dimension
+    :param seed: seed of the problem
+    :return: (num_points, 2) true positions
+    """
+    random_state = numpy.random.default_rng(seed)
+    return random_state.uniform(-expected_range, expected_range, size=(num_points, 2))
+
+def points_from_positions(point_positions: numpy.ndarray) -> List[Point]:
     points = []
     for point_i, point_position in enumerate(point_positions):
         target_distances = [
@@ -46,36 +57,33 @@ def points_from_positions(point_positions: List[Tuple[float, float]]):
 if __name__ == "__main__":
     args = parser.parse_args()
 
-    point_true_positions = [
-        numpy.array([
-            numpy.random.randint(-1 * args.expected_range, args.expected_range),
-            numpy.random.randint(-1 * args.expected_range, args.expected_range)
-        ])
-        for _ in range(args.num_points)
-    ]
-    points = points_from_positions(point_true_positions)
+    if args.dataset or args.graph_path:
+        parser.error("--dataset and --graph cannot be used, the problem is generated")
+    try:
+        validate_arguments(vars(args), args.num_points)
+    except ValueError as error:
+        parser.error(str(error))
 
-    initialize_point_positions(points)
-    validate_points(points)
+    # the problem and the restarts are both determined by --seed
+    true_positions = generate_positions(args.num_points, args.expected_range, args.seed)
+    points = points_from_positions(true_positions)
+    seeds = spawn_seeds(args.seed, args.iterations)
+    optimize_kwargs = {**vars(args), "graph": None}
 
-    animator = (
-        Animator(points, expected_range=args.expected_range)
-        if args.animate else None
-    )
-    callback = Callback(animator=animator, verbose=args.verbose)
+    for output_dir in (args.checkpoint_dir, args.record_dir):
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
 
-    optimize_kwargs = vars(args)
-    optimize_kwargs.update({"callback": callback})
-    optimize_thread = threading.Thread(
-        target=optimize_points,
-        args=(points, ),
-        kwargs=optimize_kwargs
+    results = (
+        run_restarts(points, seeds, args.workers, optimize_kwargs, args.minimum_loss, args.checkpoint_dir, args.record_dir)
+        if args.workers > 1
+        else run_sequential_restarts(points, seeds, optimize_kwargs, args.minimum_loss, args.checkpoint_dir, args.record_dir)
     )
+    summary = summarize_results(results)
+    summary["procrustes_error"] = procrustes_error(summary["positions"], true_positions)
+    write_summary(summary, args.out_path)
 
-    optimize_thread.start()
-    if animator:
-        animator.show_animation()
-    optimize_thread.join()
-
-    plot_points(points)
-    plot_loss(callback.losses)
+    if args.plot_dir:
+        os.makedirs(args.plot_dir, exist_ok=True)
+        plot_points(summary["points"], out_path=os.path.join(args.plot_dir, "best_points.png"))
+        plot_loss(summary["losses"], out_path=os.path.join(args.plot_dir, "best_loss.png"))
@@ -1,9 +1,10 @@
 from typing import List, Optional, Tuple
 
+import os
+import sys
 import numpy
-import matplotlib.pyplot as plt
 
-from models import Point
+from models import Point, Graph
 from loss import MSELoss
 
 def numpy_softmax(x: numpy.ndarray, axis: int = 0):
@@ -47,6 +48,8 @@ def plot_points(
     out_path: Optional[str] = None,
     figsize: Tuple[int, int] = (10, 10),
 ):
+    import matplotlib.pyplot as plt
+
     figure, axes = plt.subplots(figsize=figsize)
     axes.set_aspect(1)
 
@@ -66,6 +69,8 @@ def plot_loss(
     out_path: Optional[str] = None,
     figsize: Tuple[int, int] = (10, 10),
 ):
+    import matplotlib.pyplot as plt
+
     figure, axes = plt.subplots(figsize=figsize)
 
     axes.plot(losses)
@@ -84,11 +89,80 @@ def initialize_point_positions(
     expected_range: float = 1.0,
     num_dims: int = 2
 ):
-    [
-        point.initialize_position(
-            loc=loc,
-            scale=expected_range,
-            num_dims=num_dims,
-        )
-        for point in points
-    ]
+    positions = numpy.random.normal(
+        loc=loc,
+        scale=expected_range,
+        size=(len(points), num_dims)
+    )
+    for point, position in zip(points, positions):
+        point.position = position
+
+def load_dataset_graph(dataset_path: str, block_rows: int = 1024) -> Graph:
+    """
+    Loads a dataset converted by convex_optimization/dataset.py as a graph
+    of its known pairs. The distance and omega matrices are memory mapped and
+    read one block of rows at a time, so only the edges are held in memory.
+    When both (i, j) and (j, i) are known their distances are averaged, as in
+    Graph.from_points
+
+    :param dataset_path: directory of a converted dataset, see load_dataset
+    :param block_rows: number of rows read at once
+    :return: graph with one edge per known pair
+    """
+    dist, omega, names = import_convex_dataset().load_dataset(dataset_path, mmap_mode="r")
+    num_points = len(dist)
+
+    sources, targets, distances = [], [], []
+    for block_start in range(0, num_points, block_rows):
+        block_stop = block_start + block_rows
+        block_indices, columns = numpy.nonzero(omega[block_start: block_stop])
+        is_off_diagonal = block_indices + block_start != columns
+        block_indices, columns = block_indices[is_off_diagonal], columns[is_off_diagonal]
+        rows = block_indices + block_start
+
+        sources.append(numpy.minimum(rows, columns))
+        targets.append(numpy.maximum(rows, columns))
+        distances.append(numpy.asarray(dist[block_start: block_stop])[block_indices, columns])
+
+    keys, inverse = numpy.unique(
+        numpy.concatenate(sources).astype(numpy.int64) * num_points + numpy.concatenate(targets),
+        return_inverse=True
+    )
+    pair_sums = numpy.bincount(inverse, weights=numpy.concatenate(distances), minlength=len(keys))
+    pair_counts = numpy.bincount(inverse, minlength=len(keys))
+
+    return Graph(
+        num_points,
+        keys // num_points,
+        keys % num_points,
+        pair_sums / pair_counts,
+        names=names,
+    )
+
+def _add_convex_optimization_path():
+    convex_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "convex_optimization")
+    if convex_path not in sys.path:
+        sys.path.append(convex_path)
+
+def import_convex_dataset():
+    """
+    Imports convex_optimization/dataset.py, which only requires numpy
+
+    :return: dataset module
+    """
+    _add_convex_optimization_path()
+
+    import dataset
+    return dataset
+
+
+def import_convex_optimization():
+    """
+    Imports convex_optimization/optimize.py, which requires cvxpy and scipy
+
+    :return: optimize module
+    """
+    _add_convex_optimization_path()
+
+    import optimize
+    return optimize
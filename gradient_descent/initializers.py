@@ -0,0 +1,207 @@
+from typing import List, Optional
+
+import pickle
+import numpy
+
+from models import Point, Graph
+from helpers import initialize_point_positions, import_convex_optimization
+
+def _adjacency_matrix(graph: Graph, weights: numpy.ndarray):
+    """
+    :param graph: graph of known target distances
+    :param weights: weight of each edge
+    :return: symmetric scipy.sparse csr adjacency matrix
+    """
+    import scipy.sparse
+
+    return scipy.sparse.coo_matrix(
+        (
+            numpy.concatenate([weights, weights]),
+            (
+                numpy.concatenate([graph.sources, graph.targets]),
+                numpy.concatenate([graph.targets, graph.sources]),
+            ),
+        ),
+        shape=(graph.num_points, graph.num_points)
+    ).tocsr()
+
+class ShortestPathRows():
+    def __init__(self, graph: Graph):
+        """
+        Read only view of the squared shortest path distances through the
+        known pairs, indexed by rows like a matrix. Rows are computed with
+        Dijkstra when first indexed, so landmark MDS only ever computes its
+        landmark rows. Unreachable points are placed at the largest finite
+        distance of the row
+
+        :param graph: graph of known target distances
+        """
+        self._adjacency = _adjacency_matrix(graph, graph.distances)
+        self.shape = (graph.num_points, graph.num_points)
+        self._rows = {}
+
+    def __getitem__(self, indices) -> numpy.ndarray:
+        import scipy.sparse.csgraph
+
+        indices = numpy.asarray(indices)
+        missing = [int(index) for index in numpy.unique(indices) if int(index) not in self._rows]
+        if len(missing) > 0:
+            distances = scipy.sparse.csgraph.dijkstra(self._adjacency, directed=False, indices=missing)
+            for index, row in zip(missing, numpy.atleast_2d(distances)):
+                is_reachable = numpy.isfinite(row)
+                self._rows[index] = numpy.square(
+                    numpy.where(is_reachable, row, numpy.max(row[is_reachable]))
+                )
+
+        if indices.ndim == 0:
+            return self._rows[int(indices)]
+
+        return numpy.array([self._rows[int(index)] for index in indices])
+
+def initialize_mds_positions(
+    points: List[Point],
+    graph: Graph,
+    num_dims: int = 2,
+    num_landmarks: int = 100,
+):
+    """
+    MDS on shortest path distances, which complete the unknown target
+    distances. Graphs of at most num_landmarks points use classical MDS,
+    larger graphs use landmark MDS, which only needs shortest paths from
+    each landmark. Both are convex_optimization's implementations
+
+    :param points: points to initialize, one per node of graph
+    :param graph: graph of known target distances
+    :param num_dims: number of spatial dimensions
+    :param num_landmarks: number of landmark points
+    """
+    optimize = import_convex_optimization()
+    squared_distances = ShortestPathRows(graph)
+
+    if graph.num_points <= num_landmarks:
+        P = optimize.classical_mds(
+            squared_distances[numpy.arange(graph.num_points)],
+            num_spatial_dims=num_dims
+        )
+    else:
+        P = optimize.landmark_mds(squared_distances, num_spatial_dims=num_dims, num_landmarks=num_landmarks)
+
+    _set_positions(points, numpy.asarray(P).T)
+
+def initialize_spectral_positions(
+    points: List[Point],
+    graph: Graph,
+    num_dims: int = 2,
+    max_dense_points: int = 2000,
+):
+    """
+    Laplacian eigenmap of the graph with edge weights 1 / distance. Points
+    are placed using the eigenvectors of the smallest nonzero eigenvalues of
+    the normalized laplacian, found densely for small graphs and with
+    Lanczos iteration (ARPACK) on the sparse laplacian for large graphs. The
+    layout is scaled so that its mean edge length matches the mean target
+    distance
+
+    :param points: points to initialize, one per node of graph
+    :param graph: graph of known target distances
+    :param num_dims: number of spatial dimensions
+    :param max_dense_points: largest graph solved with a dense eigensolver
+    """
+    import scipy.sparse
+    import scipy.sparse.linalg
+
+    num_points = graph.num_points
+    weights = _adjacency_matrix(graph, 1.0 / numpy.maximum(graph.distances, 1e-12))
+    degrees = numpy.maximum(numpy.asarray(weights.sum(axis=1)).ravel(), 1e-12)
+
+    # D^-1/2 W D^-1/2 = I - normalized laplacian, so its largest eigenvectors
+    # are the laplacian's smallest
+    scale = scipy.sparse.diags(1.0 / numpy.sqrt(degrees))
+    normalized_weights = scale @ weights @ scale
+    num_eigenpairs = min(num_dims + 1, num_points)
+
+    if num_points <= max_dense_points or num_eigenpairs >= num_points - 1:
+        _, eigenvectors = numpy.linalg.eigh(normalized_weights.toarray())
+        eigenvectors = eigenvectors[:, ::-1][:, :num_eigenpairs]
+    else:
+        # shifted by I so the wanted eigenvalues are also the largest in
+        # magnitude, which Lanczos finds fastest
+        eigenvalues, eigenvectors = scipy.sparse.linalg.eigsh(
+            normalized_weights + scipy.sparse.identity(num_points),
+            k=num_eigenpairs,
+            which="LA"
+        )
+        eigenvectors = eigenvectors[:, numpy.argsort(eigenvalues)[::-1]]
+
+    # mapped back to random walk eigenvectors, skipping the trivial one
+    positions = eigenvectors[:, 1: num_dims + 1] / numpy.sqrt(degrees)[:, numpy.newaxis]
+
+    edge_lengths = numpy.linalg.norm(positions[graph.sources] - positions[graph.targets], axis=1)
+    mean_edge_length = numpy.mean(edge_lengths) if len(edge_lengths) > 0 else 0.0
+    if mean_edge_length > 0.0:
+        positions *= numpy.mean(graph.distances) / mean_edge_length
+
+    _set_positions(points, positions)
+
+def load_positions(positions_path: str) -> numpy.ndarray:
+    """
+    :param positions_path: .npy array of positions, .npz containing a
+        "positions" array, or a best_dict.pkl written by main.py
+    :return: (N, D) array of positions
+    """
+    if positions_path.endswith(".npy"):
+        return numpy.load(positions_path)
+
+    if positions_path.endswith(".npz"):
+        with numpy.load(positions_path) as arrays:
+            return arrays["positions"]
+
+    with open(positions_path, "rb") as pickle_file:
+        best_dict = pickle.load(pickle_file)
+    return numpy.array([point.position for point in best_dict["points"]])
+
+def initialize_file_positions(points: List[Point], positions_path: str):
+    """
+    :param points: points to initialize
+    :param positions_path: saved layout, see load_positions
+    """
+    positions = load_positions(positions_path)
+    if len(positions) != len(points):
+        raise ValueError("saved layout must have one position per point")
+
+    _set_positions(points, positions)
+
+def initialize_points(
+    points: List[Point],
+    method: str = "random",
+    graph: Optional[Graph] = None,
+    expected_range: float = 1.0,
+    num_dims: int = 2,
+    init_path: Optional[str] = None,
+):
+    """
+    :param points: points to initialize
+    :param method: "random", "mds", "spectral" or "file"
+    :param graph: graph of known target distances, built from the points'
+        target_distances when required
+    :param expected_range: scale of random positions
+    :param num_dims: number of spatial dimensions
+    :param init_path: saved layout used by the "file" method
+    """
+    if method == "random":
+        initialize_point_positions(points, expected_range=expected_range, num_dims=num_dims)
+    elif method == "file":
+        if init_path is None: raise ValueError("init_path is required to initialize from a file")
+        initialize_file_positions(points, init_path)
+    elif method in ("mds", "spectral"):
+        graph = graph if graph is not None else Graph.from_points(points)
+        if method == "mds":
+            initialize_mds_positions(points, graph, num_dims=num_dims)
+        else:
+            initialize_spectral_positions(points, graph, num_dims=num_dims)
+    else:
+        raise ValueError(f"Unknown initialization method {method}")
+
+def _set_positions(points: List[Point], positions: numpy.ndarray):
+    for point, position in zip(points, positions):
+        point.position = numpy.array(position, dtype=numpy.float64)
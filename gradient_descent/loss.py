@@ -1,38 +1,116 @@
-from typing import List
+from typing import List, Optional
 
 import numpy
+from concurrent.futures import ThreadPoolExecutor
 
-from models import Point
+from models import Point, Graph
+from spatial import find_close_pairs
+from tiling import calc_tile_rows, map_row_tiles
 
-class MSELoss():
-    def __init__(self, points: List[Point]):
+class Loss():
+    def __init__(self, points: List[Point], dtype: numpy.dtype = numpy.float64):
+        """
+        Packs all point positions into a single contiguous (N, D) array and
+        rebinds each point's position to a row view of that array, so that
+        in-place updates to point.position (as done by the optimizer) are
+        reflected in the loss without copying
+
+        Subclasses set target_counts and keep _squared_residual_sums current
+        through _refresh and _update
+
+        :param points: points to calculate losses for
+        :param dtype: dtype of positions, targets, residuals and gradients,
+            see resolve_dtype
+        """
         self._points = points
+        self._point_indices = {id(point): index for index, point in enumerate(points)}
 
-    def calc_total_loss(self, weighted: bool = False):
-        weights=[
-            numpy.count_nonzero(point.target_distances is not None)
-            for point in self._points
-        ] if weighted else None
+        self.positions = numpy.array(
+            [point.position for point in points],
+            dtype=dtype
+        )
+        for point, position in zip(points, self.positions):
+            point.position = position
 
-        return numpy.average(self.calc_point_losses(), weights=weights)
+    @property
+    def point_losses(self) -> numpy.ndarray:
+        """
+        :return: cached per-point losses, kept current by update
+        """
+        return self._point_losses
 
-    def calc_point_losses(self):
-        return [self.calc_loss(point) for point in self._points]
+    @property
+    def total_loss(self) -> float:
+        """
+        :return: cached total loss, kept current by update
+        """
+        return self._point_loss_sum / len(self._point_losses)
 
-    def calc_loss(self, point: Point) -> float:
-        losses = []
-        for target_point, target_distance in zip(self._points, point.target_distances):
-            if target_distance is None: continue
+    def index_of(self, point: Point) -> int:
+        return self._point_indices[id(point)]
 
-            actual_distance = numpy.linalg.norm(point.position - target_point.position)
+    def refresh(self):
+        """
+        Recomputes all cached residuals and losses from scratch. Called
+        periodically to discard floating point drift accumulated by update
+        """
+        self._refresh()
+        self._point_losses = self._mean_over_targets(self._squared_residual_sums)
+        self._point_loss_sum = float(numpy.sum(self._point_losses, dtype=numpy.float64))
 
-            loss = (actual_distance - target_distance) ** 2
-            losses.append(loss)
+    def update(self, indices: numpy.ndarray) -> numpy.ndarray:
+        """
+        Updates the cached residuals and losses after the points at indices
+        have moved, touching only the residuals which involve them
 
-        if losses:
-            return numpy.mean(losses)
-        else:
-            return 0.0
+        :param indices: indices of points which have moved since the last
+            update or refresh, duplicates are ignored
+        :return: indices of points whose losses have changed
+        """
+        # residual sums are adjusted once per index, so duplicates would
+        # subtract the same residuals repeatedly
+        changed_indices = self._update(numpy.unique(indices))
+
+        point_losses = self._mean_over_targets(
+            self._squared_residual_sums[changed_indices],
+            changed_indices
+        )
+        self._point_loss_sum += float(numpy.sum(
+            point_losses - self._point_losses[changed_indices],
+            dtype=numpy.float64
+        ))
+        self._point_losses[changed_indices] = point_losses
+
+        return changed_indices
+
+    def _refresh(self):
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Releases resources held by the loss, such as worker threads
+        """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _update(self, indices: numpy.ndarray) -> numpy.ndarray:
+        raise NotImplementedError()
+
+    def calc_total_loss(self, weighted: bool = False):
+        weights = self.target_counts if weighted else None
+
+        return numpy.average(self.calc_point_losses(), weights=weights)
+
+    def calc_point_losses(self) -> numpy.ndarray:
+        raise NotImplementedError()
+
+    def calc_loss(self, point: Point) -> float:
+        raise NotImplementedError()
 
     def calc_gradient(self, point: Point) -> numpy.ndarray:
         """
@@ -45,14 +123,422 @@ class MSELoss():
         :param point: point whose gradient is being calculated
         :return: gradient wrt MSE loss
         """
-        point_positions = [_point.position for _point in self._points]
-        target_gradients = []
-        for target_point, target_distance in zip(self._points, point.target_distances):
-            if target_distance is None: continue
+        index = self.index_of(point)
+        return self.calc_gradients([index])[0]
+
+    def calc_gradients(self, indices: Optional[numpy.ndarray] = None) -> numpy.ndarray:
+        raise NotImplementedError()
+
+    def calc_cached_gradients(self, indices: Optional[numpy.ndarray] = None) -> numpy.ndarray:
+        """
+        Same as calc_gradients, but may reuse the cached residuals. Only
+        valid while they are current, i.e. no point has moved since the last
+        update or refresh
+
+        :param indices: indices of points whose gradients are being
+            calculated, defaults to all points
+        :return: array of gradients, one row per index
+        """
+        return self.calc_gradients(indices)
+
+    def _mean_over_targets(
+        self,
+        sums: numpy.ndarray,
+        indices: Optional[numpy.ndarray] = None,
+    ) -> numpy.ndarray:
+        counts = self.target_counts if indices is None else self.target_counts[indices]
+        counts = counts.reshape((-1, ) + (1, ) * (sums.ndim - 1)).astype(sums.dtype)
+
+        return numpy.divide(
+            sums,
+            counts,
+            out=numpy.zeros_like(sums),
+            where=counts > 0
+        )
+
+class MSELoss(Loss):
+    # (tile rows, N) temporaries alive at once while computing a tile
+    TILE_TEMPORARIES = 6
+
+    def __init__(
+        self,
+        points: List[Point],
+        memory_budget: Optional[int] = None,
+        num_threads: int = 1,
+        dtype: numpy.dtype = numpy.float64,
+    ):
+        """
+        Dense loss where unknown target distances are stored as 0 and
+        excluded via target_mask
+
+        Full passes over the pairwise distances are computed in tiles of rows
+        so that their scratch memory stays within memory_budget rather than
+        growing with N^2, and tiles are spread over num_threads threads. The
+        cached residual and target matrices are still N^2, and are allocated
+        once and refilled in place. Call close, or use the loss as a context
+        manager, to stop the threads
+
+        :param points: points to calculate losses for
+        :param memory_budget: maximum scratch bytes of all tiles in flight,
+            None computes every row in one tile
+        :param num_threads: number of threads computing tiles
+        :param dtype: see Loss
+        """
+        super().__init__(points, dtype)
+
+        # None entries become nan when cast to float, then 0 once masked
+        self.target_distances = numpy.array(
+            [point.target_distances for point in points],
+            dtype=dtype
+        ).reshape(len(points), len(points))
+        self.target_mask = ~numpy.isnan(self.target_distances)
+        self.target_distances[~self.target_mask] = 0.0
+        self.target_counts = numpy.count_nonzero(self.target_mask, axis=1)
+
+        self._tile_rows = calc_tile_rows(
+            len(points),
+            self.TILE_TEMPORARIES * len(points) * self.positions.itemsize,
+            memory_budget,
+            num_threads,
+        )
+        self._executor = ThreadPoolExecutor(max_workers=num_threads) if num_threads > 1 else None
+
+        self._residuals = numpy.empty((len(points), len(points)), dtype=dtype)
+        self._squared_residual_sums = numpy.empty(len(points), dtype=dtype)
+        self.refresh()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _refresh(self):
+        """
+        Recomputes the cached residual matrix from scratch in O(N^2)
+        """
+        num_points = len(self.positions)
+
+        def refresh_tile(start: int, stop: int):
+            rows = numpy.arange(start, stop)
+            residuals = self._calc_residuals(self.calc_distances(rows), rows)
+            self._residuals[start:stop] = residuals
+            self._squared_residual_sums[start:stop] = numpy.sum(residuals ** 2, axis=1)
+
+        map_row_tiles(refresh_tile, num_points, self._tile_rows, self._executor)
+
+    def _update(self, indices: numpy.ndarray) -> numpy.ndarray:
+        """
+        Only the rows and columns of the moved points change, so this costs
+        O(len(indices) * N) rather than O(N^2)
+        """
+        distances = self.calc_distances(indices)
+
+        # columns first, the rows of moved points are then recomputed in full
+        column_residuals = numpy.where(
+            self.target_mask[:, indices],
+            distances.T - self.target_distances[:, indices],
+            0.0
+        )
+        self._squared_residual_sums += numpy.sum(
+            column_residuals ** 2 - self._residuals[:, indices] ** 2,
+            axis=1
+        )
+        self._residuals[:, indices] = column_residuals
+
+        row_residuals = self._calc_residuals(distances, indices)
+        self._residuals[indices] = row_residuals
+        self._squared_residual_sums[indices] = numpy.sum(row_residuals ** 2, axis=1)
+
+        changed = numpy.any(self.target_mask[:, indices], axis=1)
+        changed[indices] = True
+        return numpy.flatnonzero(changed)
+
+    def calc_point_losses(self) -> numpy.ndarray:
+        squared_residual_sums = numpy.empty(len(self.positions), dtype=self.positions.dtype)
+
+        def sum_tile(start: int, stop: int):
+            rows = numpy.arange(start, stop)
+            residuals = self._calc_residuals(self.calc_distances(rows), rows)
+            squared_residual_sums[start:stop] = numpy.sum(residuals ** 2, axis=1)
+
+        map_row_tiles(sum_tile, len(self.positions), self._tile_rows, self._executor)
+
+        return self._mean_over_targets(squared_residual_sums)
+
+    def calc_loss(self, point: Point) -> float:
+        index = self.index_of(point)
+        residuals = self._calc_residuals(self.calc_distances([index]), [index])
+
+        return self._mean_over_targets(numpy.sum(residuals ** 2, axis=1), [index])[0]
+
+    def calc_gradients(self, indices: Optional[numpy.ndarray] = None) -> numpy.ndarray:
+        """
+        Vectorized form of calc_gradient. The sum over targets j of
+        w_ij * (x_i - x_j) is expanded to x_i * sum_j(w_ij) - (w @ X)_i so that
+        no (N, N, D) difference tensor is materialized. Rows are computed in
+        tiles, see MSELoss
+
+        :param indices: indices of points whose gradients are being
+            calculated, defaults to all points
+        :return: array of gradients wrt MSE loss, one row per index
+        """
+        indices = numpy.arange(len(self.positions)) if indices is None else numpy.atleast_1d(indices)
+        gradients = numpy.empty((len(indices), self.positions.shape[1]), dtype=self.positions.dtype)
+
+        def gradient_tile(start: int, stop: int):
+            rows = indices[start:stop]
+            distances = self.calc_distances(rows)
+            gradients[start:stop] = self._sum_gradients(rows, self._calc_residuals(distances, rows), distances)
+
+        map_row_tiles(gradient_tile, len(indices), self._tile_rows, self._executor)
+
+        return self._mean_over_targets(gradients, indices)
+
+    def calc_cached_gradients(self, indices: Optional[numpy.ndarray] = None) -> numpy.ndarray:
+        """
+        Recovers the known distances from the cached residuals as residual +
+        target, which skips recomputing the distances. After a full batch
+        step the refresh has already paid for them, so this halves the
+        O(N^2) work per step. Unknown pairs have residual and target 0, so
+        their weight is 0 as in calc_gradients
+        """
+        indices = numpy.arange(len(self.positions)) if indices is None else numpy.atleast_1d(indices)
+        gradients = numpy.empty((len(indices), self.positions.shape[1]), dtype=self.positions.dtype)
+
+        def gradient_tile(start: int, stop: int):
+            rows = indices[start:stop]
+            residuals = self._residuals[rows]
+            distances = residuals + self.target_distances[rows]
+            gradients[start:stop] = self._sum_gradients(rows, residuals, distances)
+
+        map_row_tiles(gradient_tile, len(indices), self._tile_rows, self._executor)
+
+        return self._mean_over_targets(gradients, indices)
+
+    def _sum_gradients(
+        self,
+        rows: numpy.ndarray,
+        residuals: numpy.ndarray,
+        distances: numpy.ndarray,
+    ) -> numpy.ndarray:
+        weights = numpy.divide(
+            residuals,
+            distances,
+            out=numpy.zeros_like(residuals),
+            where=distances > 0.0
+        )
+        return (
+            self.positions[rows] * numpy.sum(weights, axis=1, keepdims=True)
+            - weights @ self.positions
+        )
+
+    def calc_distances(self, indices: Optional[numpy.ndarray] = None) -> numpy.ndarray:
+        """
+        :param indices: indices of points whose distance rows are calculated,
+            defaults to all points
+        :return: (len(indices), N) array of euclidean distances to every point
+        """
+        rows = self.positions if indices is None else self.positions[indices]
+
+        squared_distances = numpy.zeros((len(rows), len(self.positions)), dtype=self.positions.dtype)
+        for dim_i in range(self.positions.shape[1]):
+            squared_distances += (
+                rows[:, dim_i, numpy.newaxis] - self.positions[numpy.newaxis, :, dim_i]
+            ) ** 2
+
+        return numpy.sqrt(squared_distances)
+
+    def _calc_residuals(
+        self,
+        distances: numpy.ndarray,
+        indices: Optional[numpy.ndarray] = None,
+    ) -> numpy.ndarray:
+        targets = self.target_distances if indices is None else self.target_distances[indices]
+        mask = self.target_mask if indices is None else self.target_mask[indices]
+
+        return numpy.where(mask, distances - targets, 0.0)
+
+class EdgeMSELoss(Loss):
+    def __init__(
+        self,
+        points: List[Point],
+        graph: Graph,
+        repulsion_weight: float = 0.0,
+        repulsion_radius: Optional[float] = None,
+        dtype: numpy.dtype = numpy.float64,
+    ):
+        """
+        Sparse loss over the edges of a graph. Each point's loss is the mean
+        squared residual over its incident edges, so losses and gradients cost
+        O(E) rather than O(N^2)
+
+        Because non-edges are unconstrained, points may collapse onto each
+        other. A repulsion term (r - d) ^ 2 over non-edge pairs closer than
+        repulsion_radius r pushes them apart. It only contributes to the
+        gradients, reported losses remain the edge stress
+
+        :param points: points to calculate losses for
+        :param graph: graph of known target distances between points
+        :param repulsion_weight: weight of the repulsion term, 0 disables it
+        :param repulsion_radius: distance below which non-edge pairs repel,
+            defaults to the median target distance
+        :param dtype: see Loss
+        """
+        super().__init__(points, dtype)
+
+        if graph.num_points != len(points):
+            raise ValueError("graph must have one node per point")
+
+        self.graph = graph
+        self.target_counts = graph.degrees
+        self._target_distances = graph.distances.astype(dtype)
+
+        self._repulsion_weight = repulsion_weight
+        self._repulsion_radius = float(
+            repulsion_radius if repulsion_radius is not None
+            else numpy.median(graph.distances) if graph.num_edges > 0
+            else 1.0
+        )
+
+        self.refresh()
+
+    def _refresh(self):
+        """
+        Recomputes the cached edge residuals from scratch in O(E)
+        """
+        self._residuals = self._calc_residuals()
+        self._squared_residual_sums = self._sum_over_endpoints(self._residuals ** 2)
+
+    def _update(self, indices: numpy.ndarray) -> numpy.ndarray:
+        """
+        Only the edges incident to the moved points change, so this costs
+        O(degree) rather than O(E)
+        """
+        edges = self.graph.incident_edges(indices)
+        sources = self.graph.sources[edges]
+        targets = self.graph.targets[edges]
+
+        residuals = self._calc_residuals(edges)
+        squared_changes = residuals ** 2 - self._residuals[edges] ** 2
+        numpy.add.at(self._squared_residual_sums, sources, squared_changes)
+        numpy.add.at(self._squared_residual_sums, targets, squared_changes)
+        self._residuals[edges] = residuals
+
+        return numpy.unique(numpy.concatenate([indices, sources, targets]))
+
+    def calc_point_losses(self) -> numpy.ndarray:
+        return self._mean_over_targets(self._sum_over_endpoints(self._calc_residuals() ** 2))
+
+    def calc_loss(self, point: Point) -> float:
+        index = self.index_of(point)
+        edges = self.graph.incident_edges([index])
+        residuals = self._calc_residuals(edges)
+
+        return self._mean_over_targets(numpy.array([numpy.sum(residuals ** 2)]), [index])[0]
+
+    def calc_gradients(self, indices: Optional[numpy.ndarray] = None) -> numpy.ndarray:
+        """
+        Sums (d - t) / d * (x_i - x_j) over the incident edges of each point
+
+        :param indices: indices of points whose gradients are being
+            calculated, defaults to all points
+        :return: array of gradients wrt MSE loss, one row per index
+        """
+        edges = (
+            numpy.arange(self.graph.num_edges) if indices is None
+            else self.graph.incident_edges(indices)
+        )
+        sources = self.graph.sources[edges]
+        targets = self.graph.targets[edges]
+
+        differences = self.positions[sources] - self.positions[targets]
+        distances = numpy.linalg.norm(differences, axis=1)
+        residuals = distances - self._target_distances[edges]
+        edge_gradients = differences * numpy.divide(
+            residuals,
+            distances,
+            out=numpy.zeros_like(residuals),
+            where=distances > 0.0
+        )[:, numpy.newaxis]
+
+        if indices is None:
+            gradients = numpy.zeros_like(self.positions)
+            numpy.add.at(gradients, sources, edge_gradients)
+            numpy.add.at(gradients, targets, -1 * edge_gradients)
+        else:
+            # scatter into rows of the requested indices only
+            indices = numpy.atleast_1d(indices)
+            order = numpy.argsort(indices)
+            sorted_indices = indices[order]
+            gradients = numpy.zeros((len(indices), self.positions.shape[1]), dtype=self.positions.dtype)
+            for endpoints, sign in ((sources, 1), (targets, -1)):
+                positions = numpy.searchsorted(sorted_indices, endpoints)
+                positions = numpy.minimum(positions, len(indices) - 1)
+                is_requested = sorted_indices[positions] == endpoints
+                numpy.add.at(
+                    gradients,
+                    order[positions[is_requested]],
+                    sign * edge_gradients[is_requested]
+                )
+
+        gradients = self._mean_over_targets(gradients, indices)
+        if self._repulsion_weight > 0.0:
+            gradients += self._repulsion_weight * self.calc_repulsion_gradients(indices)
+
+        return gradients
+
+    def calc_repulsion_gradients(self, indices: Optional[numpy.ndarray] = None) -> numpy.ndarray:
+        """
+        Sums (d - r) / d * (x_i - x_j) over non-edge pairs closer than r. When
+        all points are requested, close pairs are found with a spatial grid in
+        about O(N log N). Otherwise distances from the requested points to
+        every point are computed directly in O(len(indices) * N)
+
+        :param indices: indices of points whose gradients are being
+            calculated, defaults to all points
+        :return: array of repulsion gradients, one row per index
+        """
+        if indices is None:
+            rows, columns = find_close_pairs(self.positions, self._repulsion_radius)
+            row_indices = rows
+        else:
+            indices = numpy.atleast_1d(indices)
+            differences = self.positions[indices, numpy.newaxis, :] - self.positions[numpy.newaxis, :, :]
+            distances = numpy.linalg.norm(differences, axis=2)
+            distances[numpy.arange(len(indices)), indices] = numpy.inf
+            row_indices, columns = numpy.nonzero(distances < self._repulsion_radius)
+            rows = indices[row_indices]
+
+        is_repelled = ~self.graph.contains_pairs(rows, columns)
+        rows, columns, row_indices = rows[is_repelled], columns[is_repelled], row_indices[is_repelled]
+
+        differences = self.positions[rows] - self.positions[columns]
+        distances = numpy.linalg.norm(differences, axis=1)
+        pair_gradients = differences * numpy.divide(
+            distances - self._repulsion_radius,
+            distances,
+            out=numpy.zeros_like(distances),
+            where=distances > 0.0
+        )[:, numpy.newaxis]
+
+        num_rows = len(self.positions) if indices is None else len(indices)
+        gradients = numpy.zeros((num_rows, self.positions.shape[1]), dtype=self.positions.dtype)
+        numpy.add.at(gradients, row_indices, pair_gradients)
+
+        return gradients
 
-            actual_distance = numpy.linalg.norm(point.position - target_point.position)
+    def _calc_residuals(self, edges: Optional[numpy.ndarray] = None) -> numpy.ndarray:
+        sources = self.graph.sources if edges is None else self.graph.sources[edges]
+        targets = self.graph.targets if edges is None else self.graph.targets[edges]
+        target_distances = self._target_distances if edges is None else self._target_distances[edges]
 
-            target_gradient = (actual_distance - target_distance) / actual_distance * (point.position - target_point.position)
-            target_gradients.append(target_gradient)
+        distances = numpy.linalg.norm(self.positions[sources] - self.positions[targets], axis=1)
+        return distances - target_distances
 
-        return numpy.average(target_gradients, axis=0)
+    def _sum_over_endpoints(self, edge_values: numpy.ndarray) -> numpy.ndarray:
+        # bincount always accumulates in float64
+        num_points = len(self.positions)
+        return (
+            numpy.bincount(self.graph.sources, edge_values, minlength=num_points)
+            + numpy.bincount(self.graph.targets, edge_values, minlength=num_points)
+        ).astype(self.positions.dtype)
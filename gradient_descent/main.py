@@ -1,47 +1,131 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import os
 import argparse
+import copy
 import numpy
 import threading
 import pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from models import Point
-from loss import MSELoss
-from optimizer import SGD
+from models import Point, Graph
+from loss import MSELoss, EdgeMSELoss
+from optimizer import create_optimizer, FULL_BATCH_OPTIMIZERS
+from precision import resolve_dtype
+from sampler import TemperatureSampler
 from animator import Animator
 from callback import Callback
+from recording import PositionRecorder
+from profiler import Profiler, NullProfiler, print_report
+from checkpoint import save_checkpoint, load_checkpoint
+from convergence import ConvergenceMonitor
+from initializers import initialize_points
 from helpers import (
-    initialize_point_positions,
     validate_points,
-    numpy_softmax,
     negate_values,
+    load_dataset_graph,
     plot_points,
     plot_loss
 )
 
+def add_optimize_arguments(parser: argparse.ArgumentParser):
+    """
+    Adds the problem, optimizer and run arguments shared by every entry point
+
+    :param parser: parser to add arguments to
+    """
+    parser.add_argument("--minimum_loss", type=float, default=0.0)
+    parser.add_argument("--max_steps", type=int, default=30000)
+    parser.add_argument("--learning_rate", type=float, default=0.03)
+    parser.add_argument("--momentum", type=float, default=0.99)
+    parser.add_argument("--initial_temperature", type=float, default=500.0)
+    parser.add_argument("--change_temperature", type=float, default=-0.007)
+    parser.add_argument("--expected_range", type=float, default=500)
+    parser.add_argument("--iterations", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--dataset", type=str, default=None)
+    parser.add_argument("--graph", dest="graph_path", type=str, default=None)
+    parser.add_argument("--resync_steps", type=int, default=1000)
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--memory_budget_mb", type=float, default=None)
+    parser.add_argument("--loss_threads", type=int, default=1)
+    parser.add_argument(
+        "--precision",
+        choices=["auto", "float32", "float64"],
+        default="auto"
+    )
+    parser.add_argument("--repulsion_weight", type=float, default=0.0)
+    parser.add_argument("--repulsion_radius", type=float, default=None)
+    parser.add_argument(
+        "--init",
+        choices=["random", "mds", "spectral", "file"],
+        default=None
+    )
+    parser.add_argument("--init_path", type=str, default=None)
+    parser.add_argument("--multilevel", action="store_true")
+    parser.add_argument(
+        "--coarse_solver",
+        dest="coarse_solver_name",
+        choices=["gradient", "convex"],
+        default="gradient"
+    )
+    parser.add_argument("--margin", type=float, default=0.0)
+    parser.add_argument(
+        "--optimizer",
+        dest="optimizer_name",
+        choices=["sgd", "nesterov", "adam", "lbfgs"],
+        default="sgd"
+    )
+    parser.add_argument("--report_steps", type=int, default=100)
+    parser.add_argument("--report_seconds", type=float, default=None)
+    parser.add_argument("--tolerance", type=float, default=1e-4)
+    parser.add_argument("--window_steps", type=int, default=1000)
+    parser.add_argument("--patience", type=int, default=3)
+    parser.add_argument("--gradient_tolerance", type=float, default=0.0)
+    parser.add_argument("--checkpoint_dir", type=str, default=None)
+    parser.add_argument("--checkpoint_steps", type=int, default=1000)
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--profile_seconds", type=float, default=None)
+    parser.add_argument("--record_dir", type=str, default=None)
+    parser.add_argument("--record_steps", type=int, default=10)
+    parser.add_argument("--max_frames", type=int, default=1000)
+
 parser = argparse.ArgumentParser(description='Process some integers.')
-parser.add_argument("--minimum_loss", type=float, default=0.0)
-parser.add_argument("--max_steps", type=int, default=30000)
-parser.add_argument("--learning_rate", type=float, default=0.03)
-parser.add_argument("--momentum", type=float, default=0.99)
-parser.add_argument("--initial_temperature", type=float, default=500.0)
-parser.add_argument("--change_temperature", type=float, default=-0.007)
-parser.add_argument("--expected_range", type=float, default=500)
-parser.add_argument("--iterations", type=int, default=1)
+add_optimize_arguments(parser)
 parser.add_argument('--verbose', dest='verbose', action='store_true')
 parser.add_argument('--silent', dest='verbose', action='store_false')
 parser.add_argument('--animate', dest='animate', action='store_true')
 parser.add_argument('--no_animate', dest='animate', action='store_false')
 parser.set_defaults(verbose=True, animate=True)
 
-def choose_point_to_optimize(points: List[Point], loss: MSELoss, temperature: int = 150):
-    point_losses = loss.calc_point_losses()
-    p = numpy_softmax(numpy.array(point_losses) / max(temperature, 1))
+def is_full_batch_size(batch_size: int, num_points: int) -> bool:
+    return batch_size <= 0 or batch_size >= num_points
+
+def check_full_batch(optimizer_name: str, batch_size: int, num_points: int):
+    """
+    :param optimizer_name: name of the optimizer, see create_optimizer
+    :param batch_size: number of points optimized per step
+    :param num_points: number of points being optimized
+    :raises ValueError: if the optimizer requires full-batch steps which
+        batch_size does not give
+    """
+    if optimizer_name in FULL_BATCH_OPTIMIZERS and not is_full_batch_size(batch_size, num_points):
+        raise ValueError(f"optimizer {optimizer_name} requires full-batch steps, set batch_size to 0")
 
-    choice_loss = numpy.random.choice(point_losses, p=p)
-    point_index = point_losses.index(choice_loss)
+def choose_points_to_optimize(
+    sampler: Optional[TemperatureSampler],
+    num_points: int,
+    batch_size: int = 1,
+) -> numpy.ndarray:
+    if is_full_batch_size(batch_size, num_points):
+        return numpy.arange(num_points)
 
-    return points[point_index]
+    if batch_size == 1:
+        return numpy.array([sampler.sample()])
+
+    return sampler.sample_batch(batch_size)
 
 def optimize_points(
     points: List[Point],
@@ -52,101 +136,559 @@ def optimize_points(
     initial_temperature: float = 150.0,
     change_temperature: float = -1,
     expected_range: float = 1,
+    resync_steps: int = 1000,
+    batch_size: int = 1,
+    optimizer_name: str = "sgd",
+    graph: Optional[Graph] = None,
+    repulsion_weight: float = 0.0,
+    repulsion_radius: Optional[float] = None,
     callback: Optional[Callback] = None,
+    profiler: Optional[Profiler] = None,
+    checkpoint_path: Optional[str] = None,
+    checkpoint_steps: int = 1000,
+    resume: bool = False,
+    monitor: Optional[ConvergenceMonitor] = None,
+    memory_budget_mb: Optional[float] = None,
+    loss_threads: int = 1,
+    precision: str = "auto",
     **kwargs,
 ):
-    loss = MSELoss(points)
-    optimizer = SGD(learning_rate=learning_rate, momentum=momentum)
+    """
+    :param precision: "float32", "float64" or "auto" dtype of positions,
+        losses and optimizer state, see resolve_dtype
+    :param memory_budget_mb: scratch memory budget in megabytes of the dense
+        loss, which is then computed in tiles of rows, see MSELoss
+    :param loss_threads: number of threads computing tiles of the dense loss
+    :param monitor: convergence criteria. Once optimization ends, its
+        stop_reason is "converged", "gradient_norm", "minimum_loss" or
+        "max_steps"
+    :param checkpoint_path: if set, the positions, optimizer state,
+        temperature, random state, monitor state and loss history are saved
+        to this .npz file every checkpoint_steps steps and when optimization
+        ends
+    :param checkpoint_steps: steps between checkpoints
+    :param resume: continue from checkpoint_path if it exists. Runs whose
+        monitor had already stopped them return immediately
+    """
+    profiler = profiler or NullProfiler()
+    monitor = monitor or ConvergenceMonitor()
 
-    temperature = initial_temperature
-    total_loss = loss.calc_total_loss()
-    while total_loss > minimum_loss and optimizer.total_steps <= max_steps:
-        point = choose_point_to_optimize(points, loss, temperature)
-        point_loss = loss.calc_loss(point)
+    check_full_batch(optimizer_name, batch_size, len(points))
 
-        gradient = loss.calc_gradient(point)
-        optimizer.step(point, gradient)
+    # the dense loss may own a thread pool, which must not outlive the run
+    loss = None
+    try:
+        with profiler.phase("setup"):
+            dtype = resolve_dtype(precision, len(points))
+            loss = (
+                EdgeMSELoss(points, graph, repulsion_weight, repulsion_radius, dtype=dtype)
+                if graph is not None else MSELoss(
+                    points,
+                    memory_budget=(
+                        int(memory_budget_mb * 1e6) if memory_budget_mb is not None
+                        else None
+                    ),
+                    num_threads=loss_threads,
+                    dtype=dtype,
+                )
+            )
+            optimizer = create_optimizer(
+                optimizer_name,
+                loss.positions,
+                learning_rate=learning_rate,
+                momentum=momentum,
+            )
 
-        point_loss = loss.calc_loss(point)
-        total_loss = loss.calc_total_loss()
+            checkpoint = (
+                load_checkpoint(checkpoint_path)
+                if resume and checkpoint_path and os.path.exists(checkpoint_path)
+                else None
+            )
 
-        temperature += change_temperature
-        temperature = max(temperature, 1)
+            temperature = initial_temperature
+            if checkpoint is not None:
+                loss.positions[:] = checkpoint["positions"]
+                loss.refresh()
+                optimizer.load_state_dict(checkpoint["optimizer"])
+                temperature = checkpoint["temperature"]
+                numpy.random.set_state(checkpoint["random_state"])
+                if callback:
+                    callback.restore_losses(checkpoint["losses"])
 
-        if callback:
-            callback(
-                optimizer.total_steps,
-                points,
-                point,
-                point_loss,
-                total_loss,
-                temperature
+            is_full_batch = is_full_batch_size(batch_size, len(points))
+            sampler = (
+                TemperatureSampler(loss.point_losses, temperature)
+                if not is_full_batch else None
             )
+            if sampler is not None and checkpoint is not None and checkpoint["sampler"]:
+                sampler.load_state_dict(checkpoint["sampler"])
+
+            monitor.reset(len(points))
+            if checkpoint is not None and checkpoint["monitor"]:
+                monitor.load_state_dict(checkpoint["monitor"])
+
+        # the checkpoint is of a run which already converged
+        if monitor.stop_reason is not None:
+            return points
+
+        total_loss = loss.total_loss
+        while total_loss > minimum_loss and optimizer.total_steps <= max_steps:
+            with profiler.phase("select"):
+                indices = choose_points_to_optimize(sampler, len(points), batch_size)
+                point = points[indices[0]] if len(indices) == 1 else None
+
+            # the residual cache is current here, since every step ends with
+            # an update or refresh
+            with profiler.phase("gradient"):
+                gradients = loss.calc_cached_gradients(indices)
+            with profiler.phase("step"):
+                optimizer.step(gradients, indices)
+
+            # only the moved points' rows and columns of residuals change
+            with profiler.phase("loss"):
+                if optimizer.total_steps % resync_steps == 0 or is_full_batch:
+                    loss.refresh()
+                    changed_indices = numpy.arange(len(points))
+                    profiler.count("loss_refreshes")
+                else:
+                    changed_indices = loss.update(indices)
+                    profiler.count("loss_updates")
+                profiler.count("point_loss_evaluations", len(changed_indices))
+
+                point_losses = loss.point_losses
+                point_loss = numpy.mean(point_losses[indices])
+                total_loss = loss.total_loss
+
+            temperature += change_temperature
+            temperature = max(temperature, 1)
+
+            if sampler is not None:
+                with profiler.phase("sampler"):
+                    sampler.update(changed_indices, point_losses[changed_indices])
+                    sampler.set_temperature(temperature)
+
+            if callback:
+                with profiler.phase("callback"):
+                    callback(
+                        optimizer.total_steps,
+                        points,
+                        point,
+                        point_loss,
+                        total_loss,
+                        temperature,
+                        positions=loss.positions,
+                    )
+
+            # the monitor evaluates this step before it is checkpointed, so
+            # that a resumed run sees the same windows
+            has_stopped = monitor.update(optimizer.total_steps, total_loss, indices, gradients)
+
+            # a stopped run is saved once below
+            if checkpoint_path and optimizer.total_steps % checkpoint_steps == 0 and not has_stopped:
+                with profiler.phase("checkpoint"):
+                    save_checkpoint(
+                        checkpoint_path,
+                        loss.positions,
+                        optimizer,
+                        temperature,
+                        losses=callback.losses if callback else None,
+                        sampler=sampler,
+                        monitor=monitor,
+                    )
+
+            profiler.step()
+
+            if has_stopped:
+                break
+
+        if monitor.stop_reason is None:
+            monitor.stop_reason = "minimum_loss" if total_loss <= minimum_loss else "max_steps"
+
+        if checkpoint_path:
+            save_checkpoint(
+                checkpoint_path,
+                loss.positions,
+                optimizer,
+                temperature,
+                losses=callback.losses if callback else None,
+                sampler=sampler,
+                monitor=monitor,
+            )
+    finally:
+        if loss is not None:
+            loss.close()
 
     return points
 
+def optimize_layout(
+    points: List[Point],
+    graph: Optional[Graph] = None,
+    multilevel: bool = False,
+    coarse_solver_name: str = "gradient",
+    margin: float = 0.0,
+    init: Optional[str] = None,
+    **optimize_kwargs,
+):
+    """
+    Runs optimize_points, or the multilevel pipeline if multilevel is set
+
+    :param points: points to optimize
+    :param graph: optional graph of known target distances, built from the
+        points' target_distances when required by the multilevel pipeline
+    :param multilevel: coarsen, solve and refine rather than optimizing the
+        full problem from its initial positions
+    :param coarse_solver_name: "gradient" or "convex" solver for the
+        coarsest level of the multilevel pipeline
+    :param margin: relative error allowed in each squared distance by the
+        convex coarse solver
+    :param init: initialization method of the coarsest level of the
+        multilevel pipeline, defaults to "mds". Without multilevel the points
+        are expected to be initialized already
+    :param optimize_kwargs: keyword arguments passed to optimize_points
+    :return: points
+    """
+    validate_arguments({"multilevel": multilevel, "init": init, **optimize_kwargs}, len(points))
+    if not multilevel:
+        return optimize_points(points, graph=graph, **optimize_kwargs)
+
+    from multilevel import optimize_multilevel, create_convex_solver
+
+    return optimize_multilevel(
+        points,
+        graph if graph is not None else Graph.from_points(points),
+        num_dims=len(points[0].position),
+        coarse_solver=(
+            create_convex_solver(margin=margin) if coarse_solver_name == "convex" else None
+        ),
+        coarse_init=init or "mds",
+        **optimize_kwargs,
+    )
+
+def validate_arguments(optimize_kwargs: Dict[str, Any], num_points: int):
+    """
+    Rejects combinations of arguments which would otherwise only fail, or be
+    ignored, once optimization has started
+
+    :param optimize_kwargs: parsed arguments
+    :param num_points: number of points being optimized
+    """
+    if optimize_kwargs.get("multilevel") and optimize_kwargs.get("init") == "file":
+        raise ValueError("--init file cannot be combined with --multilevel, which overwrites the initial positions")
+
+    check_full_batch(
+        optimize_kwargs.get("optimizer_name", "sgd"),
+        optimize_kwargs.get("batch_size", 1),
+        num_points
+    )
+
+def get_point_init(optimize_kwargs: Dict[str, Any]) -> str:
+    """
+    :param optimize_kwargs: parsed arguments
+    :return: initialization method of the points. The multilevel pipeline
+        overwrites their positions and applies --init to its coarsest level
+        instead, so they are initialized randomly
+    """
+    if optimize_kwargs.get("multilevel"):
+        return "random"
+
+    return optimize_kwargs.get("init") or "random"
+
+def create_monitor(optimize_kwargs: Dict[str, Any]) -> ConvergenceMonitor:
+    """
+    :param optimize_kwargs: parsed arguments, missing criteria are disabled
+    :return: convergence monitor of the parsed arguments
+    """
+    return ConvergenceMonitor(
+        relative_tolerance=optimize_kwargs.get("tolerance", 0.0),
+        window_steps=optimize_kwargs.get("window_steps", 1000),
+        patience=optimize_kwargs.get("patience", 1),
+        gradient_tolerance=optimize_kwargs.get("gradient_tolerance", 0.0),
+    )
+
+def get_checkpoint_path(checkpoint_dir: Optional[str], iteration_i: int) -> Optional[str]:
+    if checkpoint_dir is None:
+        return None
+
+    return os.path.join(checkpoint_dir, f"checkpoint_{iteration_i}.npz")
+
+def get_recording_path(record_dir: Optional[str], iteration_i: int) -> Optional[str]:
+    if record_dir is None:
+        return None
+
+    return os.path.join(record_dir, f"recording_{iteration_i}.npz")
+
+def create_recorder(optimize_kwargs: Dict[str, Any]) -> PositionRecorder:
+    """
+    :param optimize_kwargs: parsed arguments
+    :return: position recorder of the parsed arguments
+    """
+    return PositionRecorder(
+        every_steps=optimize_kwargs.get("record_steps", 10),
+        max_frames=optimize_kwargs.get("max_frames", 1000),
+    )
+
+def run_restart(
+    points: List[Point],
+    seed: int,
+    optimize_kwargs: Dict[str, Any],
+    checkpoint_path: Optional[str] = None,
+    recording_path: Optional[str] = None,
+):
+    """
+    Runs one restart, intended to be run in a worker process
+
+    :param points: points to optimize, positions are reinitialized
+    :param seed: seed for this restart's random state
+    :param optimize_kwargs: keyword arguments passed to optimize_layout
+    :param checkpoint_path: checkpoint of this restart, see optimize_points
+    :param recording_path: if set, position snapshots of this restart are
+        saved to this .npz file, see PositionRecorder
+    :return: result dictionary with the same keys as best_dict, plus the
+        stop reason and a profile report if optimize_kwargs["profile"] is set
+    """
+    numpy.random.seed(seed)
+    initialize_points(
+        points,
+        get_point_init(optimize_kwargs),
+        graph=optimize_kwargs.get("graph"),
+        init_path=optimize_kwargs.get("init_path"),
+    )
+    validate_points(points)
+
+    recorder = create_recorder(optimize_kwargs) if recording_path else None
+    callback = Callback(verbose=False, recorder=recorder)
+    profiler = Profiler() if optimize_kwargs.get("profile") else None
+    monitor = create_monitor(optimize_kwargs)
+    optimize_layout(
+        points,
+        **optimize_kwargs,
+        callback=callback,
+        profiler=profiler,
+        checkpoint_path=checkpoint_path,
+        monitor=monitor,
+    )
+    if recorder is not None:
+        recorder.save(recording_path, names=[point.name for point in points])
+
+    result = {
+        "points": points,
+        "loss": callback.losses[-1],
+        "losses": callback.losses,
+        "stop_reason": monitor.stop_reason,
+        "seed": seed,
+    }
+    if profiler is not None:
+        result["profile"] = profiler.report()
+
+    return result
+
+def run_restarts(
+    points: List[Point],
+    seeds: List[int],
+    workers: int,
+    optimize_kwargs: Dict[str, Any],
+    minimum_loss: float = 0.0,
+    checkpoint_dir: Optional[str] = None,
+    record_dir: Optional[str] = None,
+):
+    """
+    Spreads independent restarts over a process pool and yields each result
+    as soon as it finishes. Once a restart reaches minimum_loss, restarts
+    which have not started yet are cancelled
+
+    :param points: points to optimize
+    :param seeds: one seed per restart
+    :param workers: number of worker processes
+    :param optimize_kwargs: keyword arguments passed to optimize_layout
+    :param minimum_loss: loss at which remaining restarts are unnecessary
+    :param checkpoint_dir: directory of one checkpoint per restart
+    :param record_dir: directory of one recording per restart
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                run_restart,
+                points,
+                seed,
+                optimize_kwargs,
+                get_checkpoint_path(checkpoint_dir, iteration_i),
+                get_recording_path(record_dir, iteration_i),
+            )
+            for iteration_i, seed in enumerate(seeds)
+        ]
+
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+
+            result = future.result()
+            if result["loss"] <= minimum_loss:
+                for pending_future in futures:
+                    pending_future.cancel()
+
+            yield result
+
+def load_problem(
+    dataset: Optional[str] = None,
+    graph_path: Optional[str] = None,
+) -> Tuple[List[Point], Optional[Graph]]:
+    """
+    :param dataset: path of a converted dataset, read as the graph of its
+        known pairs, see load_dataset_graph
+    :param graph_path: path of an edge list, see Graph.from_edge_list
+    :return: points without positions and the graph of graph_path or
+        dataset, or the built in amusement park problem if neither path is
+        given
+    """
+    graph = None
+    if graph_path or dataset:
+        graph = Graph.from_edge_list(graph_path) if graph_path else load_dataset_graph(dataset)
+        points = [
+            Point(name=graph.names[index] if graph.names else str(index))
+            for index in range(graph.num_points)
+        ]
+    else:
+        points = [
+            Point([None] * 6 + negate_values([136, 74, 30, 156, 72, 109, 42, 57]), name="Jumbo Kingdom"),
+            Point([None] * 6 + negate_values([75, 88, 22, 70, 106, 118, 42, 62]), name="World's Fair"),
+            Point([None] * 6 + negate_values([67, 103, 30, 83, 109, 78, 48, 43]), name="Jumbo Studios"),
+            Point([None] * 6 + negate_values([48, 44, 35, 70, 42, 52, 25, 18]), name="Animal Planet Zoo"),
+            Point([None] * 6 + negate_values([32, 44, 47, 43, 48, 23, 19, 16]), name="Trunk Water Park"),
+            Point([None] * 6 + negate_values([27, 17, 3, 17, 15, 18, 56, 32]), name="Jumbo Golf Course"),
+
+            Point(negate_values([136, 75, 67, 48, 32, 27]) + [None] * 8, name="Tusk Hotel"),
+            Point(negate_values([74, 88, 103, 44, 44, 17]) + [None] * 8, name="Mammoth Motel"),
+            Point(negate_values([30, 22, 30, 35, 47, 3]) + [None] * 8, name="Elephant Lodge"),
+            Point(negate_values([156, 70, 83, 70, 43, 17]) + [None] * 8, name="Trunk Inn"),
+            Point(negate_values([72, 106, 109, 42, 48, 15]) + [None] * 8, name="Loxodon Lodge"),
+            Point(negate_values([109, 118, 78, 52, 23, 18]) + [None] * 8, name="Pachyderm Suites"),
+            Point(negate_values([42, 42, 48, 25, 19, 56]) + [None] * 8, name="Mouse Resort"),
+            Point(negate_values([57, 62, 43, 18, 16, 32]) + [None] * 8, name="Oliphant Camp"),
+        ]
+
+    return points, graph
+
+def spawn_seeds(seed: Optional[int], iterations: int) -> List[int]:
+    """
+    :param seed: root seed, None for a random root seed
+    :param iterations: number of restarts
+    :return: independent seed of each restart
+    """
+    return [
+        int(seed_sequence.generate_state(1)[0])
+        for seed_sequence in numpy.random.SeedSequence(seed).spawn(iterations)
+    ]
+
 if __name__ == "__main__":
     args = parser.parse_args()
 
-    points = [  # TODO: ingest graph format
-        Point([None] * 6 + negate_values([136, 74, 30, 156, 72, 109, 42, 57]), name="Jumbo Kingdom"),
-        Point([None] * 6 + negate_values([75, 88, 22, 70, 106, 118, 42, 62]), name="World's Fair"),
-        Point([None] * 6 + negate_values([67, 103, 30, 83, 109, 78, 48, 43]), name="Jumbo Studios"),
-        Point([None] * 6 + negate_values([48, 44, 35, 70, 42, 52, 25, 18]), name="Animal Planet Zoo"),
-        Point([None] * 6 + negate_values([32, 44, 47, 43, 48, 23, 19, 16]), name="Trunk Water Park"),
-        Point([None] * 6 + negate_values([27, 17, 3, 17, 15, 18, 56, 32]), name="Jumbo Golf Course"),
-
-        Point(negate_values([136, 75, 67, 48, 32, 27]) + [None] * 8, name="Tusk Hotel"),
-        Point(negate_values([74, 88, 103, 44, 44, 17]) + [None] * 8, name="Mammoth Motel"),
-        Point(negate_values([30, 22, 30, 35, 47, 3]) + [None] * 8, name="Elephant Lodge"),
-        Point(negate_values([156, 70, 83, 70, 43, 17]) + [None] * 8, name="Trunk Inn"),
-        Point(negate_values([72, 106, 109, 42, 48, 15]) + [None] * 8, name="Loxodon Lodge"),
-        Point(negate_values([109, 118, 78, 52, 23, 18]) + [None] * 8, name="Pachyderm Suites"),
-        Point(negate_values([42, 42, 48, 25, 19, 56]) + [None] * 8, name="Mouse Resort"),
-        Point(negate_values([57, 62, 43, 18, 16, 32]) + [None] * 8, name="Oliphant Camp"),
-    ]
+    points, graph = load_problem(args.dataset, args.graph_path)
+    try:
+        validate_arguments(vars(args), len(points))
+    except ValueError as error:
+        parser.error(str(error))
 
     best_dict = {
         "points": [],
         "loss": numpy.inf,
         "losses": [],
     }
-    for iteration_i in range(args.iterations):
-
-        print(f"Iteration #{iteration_i}")
-        initialize_point_positions(points)
-        validate_points(points)
+    seeds = spawn_seeds(args.seed, args.iterations)
 
-        animator = (
-            Animator(points, expected_range=args.expected_range)
-            if args.animate else None
-        )
-        callback = Callback(animator=animator, verbose=args.verbose)
+    for output_dir in (args.checkpoint_dir, args.record_dir):
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
 
+    if args.workers > 1:
         optimize_kwargs = vars(args)
-        optimize_kwargs.update({"callback": callback})
-        optimize_thread = threading.Thread(
-            target=optimize_points,
-            args=(points, ),
-            kwargs=optimize_kwargs
+        optimize_kwargs.update({"graph": graph})
+        results = run_restarts(
+            points,
+            seeds,
+            args.workers,
+            optimize_kwargs,
+            minimum_loss=args.minimum_loss,
+            checkpoint_dir=args.checkpoint_dir,
+            record_dir=args.record_dir,
         )
+        # results arrive in order of completion, so restarts are numbered by
+        # their seed, which also numbers their checkpoints and recordings
+        for result in results:
+            if result["loss"] < best_dict["loss"]:
+                best_dict = {key: result[key] for key in ("points", "loss", "losses")}
 
-        optimize_thread.start()
-        if animator:
-            animator.show_animation()
-        optimize_thread.join()
-
-        if callback.losses[-1] < best_dict["loss"]:
-            best_dict = {
-                "points": points.copy(),
-                "loss": callback.losses[-1],
-                "losses": callback.losses.copy(),
-            }
-
-        print(
-            f"Iteration loss: {callback.losses[-1]:0.3f} | "
-            f"Best loss: {best_dict['loss']:0.3f}"
-        )
+            print(
+                f"Iteration #{seeds.index(result['seed'])} (seed {result['seed']}) "
+                f"loss: {result['loss']:0.3f} | "
+                f"Best loss: {best_dict['loss']:0.3f} | "
+                f"Stopped: {result['stop_reason']}"
+            )
+            if "profile" in result:
+                print_report(result["profile"])
+    else:
+        for iteration_i in range(args.iterations):
+            print(f"Iteration #{iteration_i}")
+            numpy.random.seed(seeds[iteration_i])
+            initialize_points(points, get_point_init(vars(args)), graph=graph, init_path=args.init_path)
+            validate_points(points)
+
+            animator = (
+                Animator(points, expected_range=args.expected_range)
+                if args.animate else None
+            )
+            callback = Callback(
+                animator=animator,
+                verbose=args.verbose,
+                every_steps=args.report_steps,
+                every_seconds=args.report_seconds,
+                recorder=create_recorder(vars(args)) if args.record_dir else None,
+            )
+            profiler = (
+                Profiler(report_seconds=args.profile_seconds)
+                if args.profile else None
+            )
+            monitor = create_monitor(vars(args))
+
+            optimize_kwargs = vars(args)
+            optimize_kwargs.update({
+                "graph": graph,
+                "callback": callback,
+                "profiler": profiler,
+                "checkpoint_path": get_checkpoint_path(args.checkpoint_dir, iteration_i),
+                "monitor": monitor,
+            })
+            optimize_thread = threading.Thread(
+                target=optimize_layout,
+                args=(points, ),
+                kwargs=optimize_kwargs
+            )
+
+            optimize_thread.start()
+            if animator:
+                animator.show_animation()
+            optimize_thread.join()
+
+            if callback.recorder is not None:
+                callback.recorder.save(
+                    get_recording_path(args.record_dir, iteration_i),
+                    names=[point.name for point in points],
+                )
+
+            if profiler is not None:
+                print_report(profiler.report())
+
+            if callback.losses[-1] < best_dict["loss"]:
+                best_dict = {
+                    "points": copy.deepcopy(points),
+                    "loss": callback.losses[-1],
+                    "losses": callback.losses.copy(),
+                }
+
+            print(
+                f"Iteration loss: {callback.losses[-1]:0.3f} | "
+                f"Best loss: {best_dict['loss']:0.3f} | "
+                f"Stopped: {monitor.stop_reason}"
+            )
 
     print("Finished iteration")
 
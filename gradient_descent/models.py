@@ -1,19 +1,33 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
+import os
+import csv
 import numpy
 
 class Point():
     def __init__(
         self,
-        target_distances: List[float] = [],
+        target_distances: Optional[List[float]] = None,
         position: Optional[List[float]] = None,
         name: str = "",
     ):
-        self.target_distances = numpy.array(target_distances)
+        """
+        :param target_distances: dense row of target distances to every point,
+            None for unknown distances. Omitted for points whose targets are
+            given by a Graph
+        :param position: initial position
+        :param name: name used when plotting
+        """
+        # None entries become nan rather than making an object array
+        self.target_distances = (
+            numpy.array(target_distances, dtype=numpy.float64)
+            if target_distances is not None else None
+        )
         self.name = name
 
-        if position:
-            self.position = numpy.array(position, dtype=numpy.float32)
+        # positions are cast to the optimization dtype by Loss
+        if position is not None and len(position) > 0:
+            self.position = numpy.array(position, dtype=numpy.float64)
         else:
             self.position = None
 
@@ -30,3 +44,179 @@ class Point():
             return f"Point(name=\"{self.name}\")"
         else:
             return f"Point(({positions_string}))"
+
+class Graph():
+    def __init__(
+        self,
+        num_points: int,
+        sources: numpy.ndarray,
+        targets: numpy.ndarray,
+        distances: numpy.ndarray,
+        names: Optional[List[str]] = None,
+    ):
+        """
+        Sparse graph of known target distances stored as COO edge arrays.
+        Edges are undirected and count towards the loss of both endpoints.
+        A CSR style incidence index maps each point to its incident edges
+
+        :param num_points: number of points
+        :param sources: first endpoint of each edge
+        :param targets: second endpoint of each edge
+        :param distances: target distance of each edge
+        :param names: optional name of each point
+        """
+        self.num_points = num_points
+        self.sources = numpy.asarray(sources, dtype=numpy.int64)
+        self.targets = numpy.asarray(targets, dtype=numpy.int64)
+        self.distances = numpy.asarray(distances, dtype=numpy.float64)
+        self.names = names
+
+        num_edges = len(self.sources)
+        endpoints = numpy.concatenate([self.sources, self.targets])
+        edge_ids = numpy.concatenate([numpy.arange(num_edges), numpy.arange(num_edges)])
+
+        order = numpy.argsort(endpoints, kind="stable")
+        self.degrees = numpy.bincount(endpoints, minlength=num_points)
+        self._incidence_offsets = numpy.concatenate([[0], numpy.cumsum(self.degrees)])
+        self._incidence_edges = edge_ids[order]
+        self._pair_keys = None
+        self._pair_distances = None
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.sources)
+
+    def contains_pairs(self, rows: numpy.ndarray, columns: numpy.ndarray) -> numpy.ndarray:
+        """
+        :param rows: first point of each pair
+        :param columns: second point of each pair
+        :return: boolean array which is True where the pair is an edge, in
+            either direction
+        """
+        return numpy.isfinite(self.pair_distances(rows, columns))
+
+    def pair_distances(self, rows: numpy.ndarray, columns: numpy.ndarray) -> numpy.ndarray:
+        """
+        :param rows: first point of each pair
+        :param columns: second point of each pair
+        :return: target distance of each pair, inf where the pair is not an
+            edge in either direction
+        """
+        if self._pair_keys is None:
+            keys = numpy.concatenate([
+                self.sources * self.num_points + self.targets,
+                self.targets * self.num_points + self.sources,
+            ])
+            order = numpy.argsort(keys, kind="stable")
+            self._pair_keys = keys[order]
+            self._pair_distances = numpy.concatenate([self.distances, self.distances])[order]
+
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        columns = numpy.asarray(columns, dtype=numpy.int64)
+        if len(self._pair_keys) == 0:
+            return numpy.full(len(rows), numpy.inf)
+
+        keys = rows * self.num_points + columns
+        positions = numpy.minimum(
+            numpy.searchsorted(self._pair_keys, keys),
+            len(self._pair_keys) - 1
+        )
+        return numpy.where(self._pair_keys[positions] == keys, self._pair_distances[positions], numpy.inf)
+
+    def to_dense(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        :return: (N, N) matrix of squared target distances and boolean omega
+            matrix of known pairs, as used by convex_optimization
+        """
+        D = numpy.zeros((self.num_points, self.num_points))
+        omega = numpy.zeros((self.num_points, self.num_points), dtype=bool)
+        D[self.sources, self.targets] = D[self.targets, self.sources] = self.distances ** 2
+        omega[self.sources, self.targets] = omega[self.targets, self.sources] = True
+
+        return D, omega
+
+    def incident_edges(self, indices: numpy.ndarray) -> numpy.ndarray:
+        """
+        :param indices: indices of points
+        :return: unique ids of edges with at least one endpoint in indices
+        """
+        indices = numpy.atleast_1d(indices)
+        if len(indices) == 1:
+            index = indices[0]
+            return self._incidence_edges[
+                self._incidence_offsets[index]: self._incidence_offsets[index + 1]
+            ]
+
+        return numpy.unique(numpy.concatenate([
+            self._incidence_edges[self._incidence_offsets[index]: self._incidence_offsets[index + 1]]
+            for index in indices
+        ]))
+
+    @classmethod
+    def from_points(cls, points: List[Point]) -> "Graph":
+        """
+        Converts dense point target_distances rows to edges. When both (i, j)
+        and (j, i) are known their target distances are averaged
+
+        :param points: points with dense target_distances
+        :return: graph with one edge per known pair
+        """
+        target_distances = numpy.array(
+            [point.target_distances for point in points],
+            dtype=numpy.float64
+        ).reshape(len(points), len(points))
+
+        is_known = ~numpy.isnan(target_distances)
+        pair_counts = is_known.astype(int) + is_known.T
+        pair_sums = numpy.nan_to_num(target_distances) + numpy.nan_to_num(target_distances.T)
+        sources, targets = numpy.nonzero(numpy.triu(pair_counts > 0, k=1))
+
+        return cls(
+            len(points),
+            sources,
+            targets,
+            pair_sums[sources, targets] / pair_counts[sources, targets],
+            names=[point.name for point in points],
+        )
+
+    @classmethod
+    def from_edge_list(cls, edge_list_path: str) -> "Graph":
+        """
+        Reads an edge list. .npz files written by convex_optimization/dataset.py
+        contain rows, columns and distances arrays, and are named by the
+        names.txt next to them if it exists. Any other file is read as
+        csv lines of "source,target,distance" where sources and targets are
+        point names, indexed in order of first appearance
+
+        :param edge_list_path: path to edge list
+        :return: graph of the edge list
+        """
+        if edge_list_path.endswith(".npz"):
+            # names.txt fixes the number of points, including isolated ones
+            names_path = os.path.join(os.path.dirname(edge_list_path), "names.txt")
+            names = None
+            if os.path.exists(names_path):
+                with open(names_path, "r") as names_file:
+                    names = names_file.read().split("\n")
+
+            with numpy.load(edge_list_path) as edges:
+                sources, targets = edges["rows"], edges["columns"]
+                num_points = (
+                    len(names) if names is not None
+                    else int(max(numpy.max(sources), numpy.max(targets))) + 1 if len(sources) > 0
+                    else 0
+                )
+                return cls(num_points, sources, targets, edges["distances"], names=names)
+
+        name_indices = {}
+        sources, targets, distances = [], [], []
+        with open(edge_list_path, "r") as edge_list_file:
+            for row in csv.reader(edge_list_file):
+                if not row or row[0].startswith("#"): continue
+
+                source, target, distance = (value.strip() for value in row)
+                sources.append(name_indices.setdefault(source, len(name_indices)))
+                targets.append(name_indices.setdefault(target, len(name_indices)))
+                distances.append(float(distance))
+
+        return cls(len(name_indices), sources, targets, distances, names=list(name_indices))
@@ -0,0 +1,329 @@
+from typing import Callable, List, Optional, Tuple
+
+import numpy
+
+from models import Point, Graph
+from callback import Callback
+from main import optimize_points
+from initializers import initialize_points
+from helpers import import_convex_optimization
+
+CoarseSolver = Callable[[Graph, int], numpy.ndarray]
+
+class Level():
+    def __init__(
+        self,
+        graph: Graph,
+        parents: numpy.ndarray,
+        offsets: numpy.ndarray,
+        signs: numpy.ndarray,
+    ):
+        """
+        One level of a multilevel hierarchy, mapping the points of graph to
+        the points of the next coarser level
+
+        :param graph: graph of this level
+        :param parents: index of each point's parent in the coarser level
+        :param offsets: distance of each point from its parent, half the
+            matched edge distance or 0 for unmatched points
+        :param signs: +1 or -1 so that matched siblings are placed on
+            opposite sides of their parent
+        """
+        self.graph = graph
+        self.parents = parents
+        self.offsets = offsets
+        self.signs = signs
+
+def match_nearest_neighbors(graph: Graph, max_rounds: int = 8) -> numpy.ndarray:
+    """
+    Matches points to their nearest unmatched neighbor. In each round every
+    unmatched point proposes to its nearest unmatched neighbor and mutual
+    proposals are matched, so each round is vectorized over all edges
+
+    :param graph: graph to match
+    :param max_rounds: maximum number of proposal rounds
+    :return: index of each point's match, -1 for unmatched points
+    """
+    matches = numpy.full(graph.num_points, -1, dtype=numpy.int64)
+    sources = numpy.concatenate([graph.sources, graph.targets])
+    targets = numpy.concatenate([graph.targets, graph.sources])
+    distances = numpy.concatenate([graph.distances, graph.distances])
+
+    for _ in range(max_rounds):
+        is_free = (matches[sources] < 0) & (matches[targets] < 0) & (sources != targets)
+        if not numpy.any(is_free): break
+
+        # sort by (source, distance) so the first edge of each source is its nearest
+        free_edges = numpy.flatnonzero(is_free)
+        order = free_edges[numpy.lexsort((distances[free_edges], sources[free_edges]))]
+        is_first = numpy.concatenate([[True], sources[order][1:] != sources[order][:-1]])
+        nearest = order[is_first]
+
+        proposals = numpy.full(graph.num_points, -1, dtype=numpy.int64)
+        proposals[sources[nearest]] = targets[nearest]
+
+        proposers = sources[nearest]
+        is_mutual = proposals[proposals[proposers]] == proposers
+        matches[proposers[is_mutual]] = proposals[proposers[is_mutual]]
+
+    return matches
+
+def calc_two_hop_distances(graph: Graph, rows: numpy.ndarray, columns: numpy.ndarray) -> numpy.ndarray:
+    """
+    :param graph: graph of target distances
+    :param rows: first point of each pair
+    :param columns: second point of each pair
+    :return: shortest path distance of each pair over at most two edges,
+        inf where there is no such path
+    """
+    distances = graph.pair_distances(rows, columns)
+
+    endpoints = numpy.concatenate([graph.sources, graph.targets])
+    neighbors = numpy.concatenate([graph.targets, graph.sources])
+    neighbor_distances = numpy.concatenate([graph.distances, graph.distances])
+    order = numpy.argsort(endpoints, kind="stable")
+    neighbors, neighbor_distances = neighbors[order], neighbor_distances[order]
+    offsets = numpy.concatenate([[0], numpy.cumsum(numpy.bincount(endpoints, minlength=graph.num_points))])
+
+    # one candidate path per neighbor of each row
+    degrees = offsets[rows + 1] - offsets[rows]
+    pair_ids = numpy.repeat(numpy.arange(len(rows)), degrees)
+    neighbor_ids = (
+        numpy.repeat(offsets[rows] - numpy.cumsum(degrees) + degrees, degrees)
+        + numpy.arange(len(pair_ids))
+    )
+    path_distances = (
+        neighbor_distances[neighbor_ids]
+        + graph.pair_distances(neighbors[neighbor_ids], columns[pair_ids])
+    )
+    numpy.minimum.at(distances, pair_ids, path_distances)
+
+    return distances
+
+def coarsen_graph(graph: Graph) -> Tuple[Graph, Level]:
+    """
+    Merges matched pairs of points into single coarse points placed at their
+    midpoint. Coarse edges join the parents of fine edges
+
+    Averaging the fine target distances would shrink coarse targets at every
+    level, since fine edges mostly join the nearest children of two coarse
+    points. Instead, the distance between midpoints A of a1, a2 and B of b1,
+    b2 is |A - B|^2 = mean(|ai - bj|^2) - |a1 - a2|^2 / 4 - |b1 - b2|^2 / 4,
+    where the four child distances are shortest paths of at most two edges,
+    or through a sibling where there are none
+
+    :param graph: fine graph
+    :return: coarse graph and the level mapping graph onto it
+    """
+    matches = match_nearest_neighbors(graph)
+    indices = numpy.arange(graph.num_points)
+
+    # the lower index of each matched pair becomes the representative
+    is_representative = (matches < 0) | (indices < matches)
+    parents = numpy.empty(graph.num_points, dtype=numpy.int64)
+    parents[is_representative] = numpy.arange(numpy.count_nonzero(is_representative))
+    parents[~is_representative] = parents[matches[~is_representative]]
+
+    is_matched = matches >= 0
+    siblings = numpy.where(is_matched, matches, indices)
+    offsets = numpy.zeros(graph.num_points)
+    offsets[is_matched] = graph.pair_distances(indices[is_matched], matches[is_matched]) / 2
+    signs = numpy.where(is_representative, 1.0, -1.0)
+
+    num_coarse_points = int(numpy.count_nonzero(is_representative))
+    coarse_sources = parents[graph.sources]
+    coarse_targets = parents[graph.targets]
+    is_kept = coarse_sources != coarse_targets
+    coarse_keys = numpy.unique(
+        numpy.minimum(coarse_sources, coarse_targets)[is_kept] * num_coarse_points
+        + numpy.maximum(coarse_sources, coarse_targets)[is_kept]
+    )
+    coarse_sources = coarse_keys // num_coarse_points
+    coarse_targets = coarse_keys % num_coarse_points
+
+    # children of each coarse point, the same point twice if it is unmatched
+    representatives = numpy.flatnonzero(is_representative)
+    source_children = (representatives[coarse_sources], siblings[representatives[coarse_sources]])
+    target_children = (representatives[coarse_targets], siblings[representatives[coarse_targets]])
+    source_offsets = offsets[source_children[0]]
+    target_offsets = offsets[target_children[0]]
+
+    child_distances = [
+        [calc_two_hop_distances(graph, source_child, target_child) for target_child in target_children]
+        for source_child in source_children
+    ]
+    # pairs without a short path go through a sibling, two passes reach the
+    # pair opposite a known one
+    for _ in range(2):
+        for i, j in ((0, 0), (0, 1), (1, 0), (1, 1)):
+            child_distances[i][j] = numpy.minimum(child_distances[i][j], numpy.minimum(
+                child_distances[1 - i][j] + 2 * source_offsets,
+                child_distances[i][1 - j] + 2 * target_offsets,
+            ))
+
+    mean_squared_distances = sum(
+        child_distances[i][j] ** 2 for i in range(2) for j in range(2)
+    ) / 4
+    coarse_distances = numpy.sqrt(numpy.maximum(
+        mean_squared_distances - source_offsets ** 2 - target_offsets ** 2,
+        0.0
+    ))
+
+    coarse_graph = Graph(
+        num_coarse_points,
+        coarse_sources,
+        coarse_targets,
+        coarse_distances,
+    )
+
+    return coarse_graph, Level(graph, parents, offsets, signs)
+
+def build_hierarchy(
+    graph: Graph,
+    min_points: int = 32,
+    max_levels: int = 16,
+    min_reduction: float = 0.1,
+) -> Tuple[Graph, List[Level]]:
+    """
+    :param graph: finest graph
+    :param min_points: stop coarsening once a level has at most this many points
+    :param max_levels: maximum number of coarsening steps
+    :param min_reduction: stop coarsening once a step removes less than this
+        fraction of points
+    :return: coarsest graph and levels ordered from finest to coarsest
+    """
+    levels = []
+    while graph.num_points > min_points and len(levels) < max_levels:
+        coarse_graph, level = coarsen_graph(graph)
+        if coarse_graph.num_points > (1 - min_reduction) * graph.num_points:
+            break
+
+        levels.append(level)
+        graph = coarse_graph
+
+    return graph, levels
+
+def interpolate_positions(coarse_positions: numpy.ndarray, level: Level) -> numpy.ndarray:
+    """
+    Places each fine point at its parent's position, with matched siblings
+    pushed apart along a random direction so that they start at their
+    target distance from each other
+
+    :param coarse_positions: (num_coarse_points, D) positions of the coarse level
+    :param level: level mapping fine points onto the coarse points
+    :return: (num_fine_points, D) positions of the fine level
+    """
+    directions = numpy.random.normal(size=coarse_positions.shape)
+    directions /= numpy.maximum(numpy.linalg.norm(directions, axis=1, keepdims=True), 1e-12)
+
+    offsets = (level.signs * level.offsets)[:, numpy.newaxis]
+    return (
+        coarse_positions[level.parents]
+        + offsets * directions[level.parents]
+    )
+
+def _points_from_positions(positions: numpy.ndarray) -> List[Point]:
+    return [Point(position=position.tolist()) for position in positions]
+
+def create_gradient_solver(init: str = "mds", expected_range: float = 1.0, **optimize_kwargs) -> CoarseSolver:
+    """
+    Gradient descent from random positions folds even the small coarsest
+    graph, so it starts from MDS on shortest path distances by default, which
+    is exact classical MDS for graphs of up to 100 points
+
+    :param init: initialization method of the coarsest level, see
+        initialize_points
+    :param expected_range: scale of random initial positions
+    :param optimize_kwargs: keyword arguments passed to optimize_points
+    :return: coarse solver which runs optimize_points from initialized positions
+    """
+    def solve(graph: Graph, num_dims: int) -> numpy.ndarray:
+        points = _points_from_positions(numpy.zeros((graph.num_points, num_dims)))
+        initialize_points(points, init, graph=graph, expected_range=expected_range, num_dims=num_dims)
+        optimize_points(points, graph=graph, **optimize_kwargs)
+
+        return numpy.array([point.position for point in points])
+
+    return solve
+
+def create_convex_solver(margin: float = 0.0, solver: Optional[str] = None) -> CoarseSolver:
+    """
+    Requires cvxpy and scipy, which are only imported when this is called
+
+    :param margin: relative error allowed in each squared distance
+    :param solver: cvxpy solver name
+    :return: coarse solver which runs convex_optimization's solve_points
+    """
+    solve_points = import_convex_optimization().solve_points
+
+    def solve(graph: Graph, num_dims: int) -> numpy.ndarray:
+        D, omega = graph.to_dense()
+        P = solve_points(D, omega, num_spatial_dims=num_dims, margin=margin, solver=solver)
+        return numpy.asarray(P).T
+
+    return solve
+
+def optimize_multilevel(
+    points: List[Point],
+    graph: Graph,
+    num_dims: int = 2,
+    min_points: int = 32,
+    coarse_solver: Optional[CoarseSolver] = None,
+    coarse_init: str = "mds",
+    level_max_steps: Optional[int] = None,
+    callback: Optional[Callback] = None,
+    **optimize_kwargs,
+) -> List[Point]:
+    """
+    Coarsens graph by repeatedly merging nearest neighbors, solves the
+    coarsest graph with coarse_solver, then interpolates positions back down
+    the hierarchy and refines each level with optimize_points. The finest
+    level is always refined, even if graph was too small to coarsen
+
+    :param points: points to optimize, one per node of graph. Positions are
+        overwritten
+    :param graph: graph of known target distances between points
+    :param num_dims: number of spatial dimensions
+    :param min_points: number of points at which coarsening stops
+    :param coarse_solver: callable mapping a graph and num_dims to positions,
+        defaults to optimize_points from coarse_init positions
+    :param coarse_init: initialization method of the default coarse solver,
+        see initialize_points
+    :param level_max_steps: max_steps of the coarse and intermediate levels,
+        defaults to the max_steps of the finest level
+    :param callback: callback passed to the refinement of the finest level
+    :param optimize_kwargs: keyword arguments passed to optimize_points
+    :return: points
+    """
+    if graph.num_points != len(points):
+        raise ValueError("graph must have one node per point")
+
+    # checkpoints belong to the finest level only
+    level_kwargs = dict(optimize_kwargs)
+    level_kwargs.pop("checkpoint_path", None)
+    level_kwargs.pop("resume", None)
+    # initializers of the fine points do not apply to the coarsest level
+    level_kwargs.pop("init", None)
+    level_kwargs.pop("init_path", None)
+    if level_max_steps is not None:
+        level_kwargs["max_steps"] = level_max_steps
+
+    if coarse_solver is None:
+        coarse_solver = create_gradient_solver(init=coarse_init, **level_kwargs)
+
+    coarse_graph, levels = build_hierarchy(graph, min_points=min_points)
+    positions = coarse_solver(coarse_graph, num_dims)
+
+    for level_i, level in reversed(list(enumerate(levels))):
+        positions = interpolate_positions(positions, level)
+        if level_i == 0: break
+
+        level_points = _points_from_positions(positions)
+        optimize_points(level_points, graph=level.graph, **level_kwargs)
+        positions = numpy.array([point.position for point in level_points])
+
+    for point, position in zip(points, positions):
+        point.position = position
+    optimize_points(points, graph=graph, callback=callback, **optimize_kwargs)
+
+    return points
@@ -0,0 +1,234 @@
+from typing import Dict, Iterable, List, Optional
+
+import time
+import numpy
+
+from models import Graph
+
+class OnlineLocalizer():
+    def __init__(
+        self,
+        num_dims: int = 2,
+        learning_rate: float = 0.5,
+        max_iterations: int = 100,
+        tolerance: float = 1e-3,
+        hops: int = 1,
+        time_budget: Optional[float] = None,
+    ):
+        """
+        Keeps a live layout as distance measurements stream in. Each update
+        warm starts from the current positions and only refines the points
+        touched by the update and their neighbors within hops edges, for at
+        most max_iterations full-batch gradient steps over that neighborhood.
+        Points outside the neighborhood stay fixed, so the cost of an update
+        depends on the size of the neighborhood rather than of the layout
+
+        :param num_dims: number of spatial dimensions
+        :param learning_rate: gradient step size
+        :param max_iterations: maximum gradient steps per update
+        :param tolerance: stop once no point moves further than this in a step
+        :param hops: size of the refined neighborhood in edges
+        :param time_budget: optional maximum seconds per update
+        """
+        self._num_dims = num_dims
+        self._learning_rate = learning_rate
+        self._max_iterations = max_iterations
+        self._tolerance = tolerance
+        self._hops = hops
+        self._time_budget = time_budget
+
+        self._positions = numpy.zeros((16, num_dims))
+        self.num_points = 0
+        self.names = []
+        self.neighbors: List[Dict[int, float]] = []
+
+    @property
+    def positions(self) -> numpy.ndarray:
+        """
+        :return: (num_points, D) view of the current positions
+        """
+        return self._positions[:self.num_points]
+
+    def add_point(
+        self,
+        name: str = "",
+        distances: Optional[Dict[int, float]] = None,
+        position: Optional[numpy.ndarray] = None,
+    ) -> int:
+        """
+        :param name: name of the point
+        :param distances: measured distances from the new point to existing
+            points, keyed by index
+        :param position: initial position, defaults to multilateration from
+            distances, or the origin if there are none
+        :return: index of the new point
+        """
+        if self.num_points == len(self._positions):
+            self._positions = numpy.concatenate([self._positions, numpy.zeros_like(self._positions)])
+
+        index = self.num_points
+        self.num_points += 1
+        self.names.append(name)
+        self.neighbors.append({})
+
+        distances = distances or {}
+        self._positions[index] = (
+            position if position is not None
+            else self._multilaterate(distances)
+        )
+
+        if distances:
+            targets = list(distances.keys())
+            self.update_edges([index] * len(targets), targets, list(distances.values()))
+
+        return index
+
+    def update_edges(
+        self,
+        sources: Iterable[int],
+        targets: Iterable[int],
+        distances: Iterable[float],
+    ) -> numpy.ndarray:
+        """
+        Adds new or replaces existing distance measurements and refines the
+        affected neighborhood
+
+        :param sources: first endpoint of each edge
+        :param targets: second endpoint of each edge
+        :param distances: measured distance of each edge
+        :return: indices of the points which were refined
+        """
+        touched = set()
+        for source, target, distance in zip(sources, targets, distances):
+            if source == target: continue
+
+            self.neighbors[source][target] = float(distance)
+            self.neighbors[target][source] = float(distance)
+            touched.update((source, target))
+
+        return self.refine(touched)
+
+    def refine(self, seeds: Iterable[int]) -> numpy.ndarray:
+        """
+        :param seeds: indices of points whose neighborhood is refined
+        :return: indices of the points which were refined
+        """
+        neighborhood = set(seeds)
+        frontier = set(neighborhood)
+        for _ in range(self._hops):
+            frontier = {
+                neighbor
+                for index in frontier
+                for neighbor in self.neighbors[index]
+            } - neighborhood
+            neighborhood |= frontier
+
+        indices = numpy.array(sorted(neighborhood), dtype=numpy.int64)
+        if len(indices) == 0:
+            return indices
+
+        # incident edges of the neighborhood, as local row and global column
+        local_rows, columns, target_distances = [], [], []
+        for local_i, index in enumerate(indices):
+            for neighbor, distance in self.neighbors[index].items():
+                local_rows.append(local_i)
+                columns.append(neighbor)
+                target_distances.append(distance)
+
+        local_rows = numpy.array(local_rows, dtype=numpy.int64)
+        columns = numpy.array(columns, dtype=numpy.int64)
+        target_distances = numpy.array(target_distances)
+        counts = numpy.maximum(numpy.bincount(local_rows, minlength=len(indices)), 1)
+
+        start_time = time.perf_counter()
+        for _ in range(self._max_iterations):
+            differences = self._positions[indices[local_rows]] - self._positions[columns]
+            edge_distances = numpy.linalg.norm(differences, axis=1)
+            weights = numpy.divide(
+                edge_distances - target_distances,
+                edge_distances,
+                out=numpy.zeros_like(edge_distances),
+                where=edge_distances > 0.0
+            )
+
+            gradients = numpy.zeros((len(indices), self._num_dims))
+            for dim_i in range(self._num_dims):
+                gradients[:, dim_i] = numpy.bincount(
+                    local_rows,
+                    weights=weights * differences[:, dim_i],
+                    minlength=len(indices)
+                )
+            changes = self._learning_rate * gradients / counts[:, numpy.newaxis]
+            self._positions[indices] -= changes
+
+            if numpy.max(numpy.abs(changes)) < self._tolerance: break
+            if self._time_budget is not None and time.perf_counter() - start_time > self._time_budget: break
+
+        return indices
+
+    def to_graph(self) -> Graph:
+        """
+        :return: graph of every measurement, for example to re-solve from
+            scratch with optimize_points
+        """
+        sources, targets, distances = [], [], []
+        for index, neighbors in enumerate(self.neighbors):
+            for neighbor, distance in neighbors.items():
+                if index < neighbor:
+                    sources.append(index)
+                    targets.append(neighbor)
+                    distances.append(distance)
+
+        return Graph(self.num_points, sources, targets, distances, names=list(self.names))
+
+    @classmethod
+    def from_graph(cls, graph: Graph, positions: numpy.ndarray, **kwargs) -> "OnlineLocalizer":
+        """
+        :param graph: graph of existing measurements
+        :param positions: (N, D) solved positions of graph
+        :param kwargs: keyword arguments passed to OnlineLocalizer
+        :return: localizer continuing from positions without refining
+        """
+        localizer = cls(num_dims=positions.shape[1], **kwargs)
+        for index in range(graph.num_points):
+            localizer.add_point(
+                name=graph.names[index] if graph.names else str(index),
+                position=positions[index],
+            )
+
+        for source, target, distance in zip(graph.sources, graph.targets, graph.distances):
+            localizer.neighbors[source][target] = float(distance)
+            localizer.neighbors[target][source] = float(distance)
+
+        return localizer
+
+    def _multilaterate(self, distances: Dict[int, float]) -> numpy.ndarray:
+        """
+        Linear least squares position from distances to known points, found by
+        subtracting the first sphere equation from the others. With too few
+        points to determine a position, the point is placed at its measured
+        distance from the nearest neighbor in a random direction
+        """
+        if not distances:
+            return numpy.zeros(self._num_dims)
+
+        anchors = numpy.array(list(distances.keys()))
+        anchor_distances = numpy.array(list(distances.values()))
+        anchor_positions = self._positions[anchors]
+
+        if len(anchors) <= self._num_dims:
+            nearest = numpy.argmin(anchor_distances)
+            direction = numpy.random.normal(size=self._num_dims)
+            direction /= max(numpy.linalg.norm(direction), 1e-12)
+            return anchor_positions[nearest] + anchor_distances[nearest] * direction
+
+        # |x - a_i|^2 - |x - a_0|^2 = r_i^2 - r_0^2 is linear in x
+        A = 2 * (anchor_positions[1:] - anchor_positions[0])
+        b = (
+            anchor_distances[0] ** 2 - anchor_distances[1:] ** 2
+            + numpy.sum(anchor_positions[1:] ** 2, axis=1)
+            - numpy.sum(anchor_positions[0] ** 2)
+        )
+        position, *_ = numpy.linalg.lstsq(A, b, rcond=None)
+
+        return position
@@ -1,20 +1,256 @@
-import numpy
+from typing import Dict, Optional
 
-from models import Point
+import numpy
 
 class Optimizer:
-    pass
-
-class SGD(Optimizer):
-    def __init__(self, learning_rate: float = 0.01, momentum: float = 0.9):
+    def __init__(self, positions: numpy.ndarray, learning_rate: float = 0.01):
+        """
+        :param positions: (N, D) positions array which is updated in place.
+            Optimizer state is stored in arrays which line up with its rows
+        :param learning_rate: step size
+        """
+        self._positions = positions
         self._learning_rate = learning_rate
-        self._momentum = momentum
-        self._prev_change = 0  # implicit scalar, not vector
         self.total_steps = 0
 
-    def step(self, point: Point, gradient: numpy.ndarray):
-        change = gradient * self._learning_rate + self._momentum * self._prev_change
-        point.position -= change
+    def step(self, gradients: numpy.ndarray, indices: Optional[numpy.ndarray] = None):
+        """
+        :param gradients: gradients of the points being stepped, one row per
+            index
+        :param indices: indices of the points being stepped, defaults to all
+            points
+        """
+        if indices is None:
+            indices = numpy.arange(len(self._positions))
 
-        self._prev_change = change
+        self._positions[indices] -= self._calc_change(gradients, indices)
         self.total_steps += 1
+
+    def state_dict(self) -> Dict[str, numpy.ndarray]:
+        """
+        :return: arrays of optimizer state, which can be saved with numpy.savez
+        """
+        return {"total_steps": numpy.array(self.total_steps)}
+
+    def load_state_dict(self, state_dict: Dict[str, numpy.ndarray]):
+        """
+        :param state_dict: arrays returned by state_dict
+        """
+        self.total_steps = int(state_dict["total_steps"])
+
+    def _calc_change(self, gradients: numpy.ndarray, indices: numpy.ndarray) -> numpy.ndarray:
+        raise NotImplementedError()
+
+class SGD(Optimizer):
+    def __init__(
+        self,
+        positions: numpy.ndarray,
+        learning_rate: float = 0.01,
+        momentum: float = 0.9,
+    ):
+        super().__init__(positions, learning_rate)
+        self._momentum = momentum
+        self._prev_change = numpy.zeros_like(positions)
+
+    def _calc_change(self, gradients: numpy.ndarray, indices: numpy.ndarray) -> numpy.ndarray:
+        change = gradients * self._learning_rate + self._momentum * self._prev_change[indices]
+
+        self._prev_change[indices] = change
+        return change
+
+    def state_dict(self) -> Dict[str, numpy.ndarray]:
+        return {**super().state_dict(), "prev_change": self._prev_change}
+
+    def load_state_dict(self, state_dict: Dict[str, numpy.ndarray]):
+        super().load_state_dict(state_dict)
+        self._prev_change[:] = state_dict["prev_change"]
+
+class Nesterov(Optimizer):
+    def __init__(
+        self,
+        positions: numpy.ndarray,
+        learning_rate: float = 0.01,
+        momentum: float = 0.9,
+    ):
+        super().__init__(positions, learning_rate)
+        self._momentum = momentum
+        self._velocity = numpy.zeros_like(positions)
+
+    def _calc_change(self, gradients: numpy.ndarray, indices: numpy.ndarray) -> numpy.ndarray:
+        """
+        Uses the reformulation which evaluates the gradient at the current
+        position rather than at the look-ahead position
+
+        v = momentum * v + lr * g
+        change = momentum * v + lr * g
+        """
+        velocity = self._momentum * self._velocity[indices] + gradients * self._learning_rate
+
+        self._velocity[indices] = velocity
+        return self._momentum * velocity + gradients * self._learning_rate
+
+    def state_dict(self) -> Dict[str, numpy.ndarray]:
+        return {**super().state_dict(), "velocity": self._velocity}
+
+    def load_state_dict(self, state_dict: Dict[str, numpy.ndarray]):
+        super().load_state_dict(state_dict)
+        self._velocity[:] = state_dict["velocity"]
+
+class Adam(Optimizer):
+    def __init__(
+        self,
+        positions: numpy.ndarray,
+        learning_rate: float = 0.01,
+        beta_1: float = 0.9,
+        beta_2: float = 0.999,
+        epsilon: float = 1e-8,
+    ):
+        super().__init__(positions, learning_rate)
+        self._beta_1 = beta_1
+        self._beta_2 = beta_2
+        self._epsilon = epsilon
+
+        self._first_moment = numpy.zeros_like(positions)
+        self._second_moment = numpy.zeros_like(positions)
+        self._point_steps = numpy.zeros((len(positions), 1), dtype=positions.dtype)  # for bias correction
+
+    def _calc_change(self, gradients: numpy.ndarray, indices: numpy.ndarray) -> numpy.ndarray:
+        first_moment = self._beta_1 * self._first_moment[indices] + (1 - self._beta_1) * gradients
+        second_moment = self._beta_2 * self._second_moment[indices] + (1 - self._beta_2) * gradients ** 2
+        point_steps = self._point_steps[indices] + 1
+
+        self._first_moment[indices] = first_moment
+        self._second_moment[indices] = second_moment
+        self._point_steps[indices] = point_steps
+
+        first_moment_hat = first_moment / (1 - self._beta_1 ** point_steps)
+        second_moment_hat = second_moment / (1 - self._beta_2 ** point_steps)
+
+        return self._learning_rate * first_moment_hat / (numpy.sqrt(second_moment_hat) + self._epsilon)
+
+    def state_dict(self) -> Dict[str, numpy.ndarray]:
+        return {
+            **super().state_dict(),
+            "first_moment": self._first_moment,
+            "second_moment": self._second_moment,
+            "point_steps": self._point_steps,
+        }
+
+    def load_state_dict(self, state_dict: Dict[str, numpy.ndarray]):
+        super().load_state_dict(state_dict)
+        self._first_moment[:] = state_dict["first_moment"]
+        self._second_moment[:] = state_dict["second_moment"]
+        self._point_steps[:] = state_dict["point_steps"]
+
+class LBFGS(Optimizer):
+    def __init__(
+        self,
+        positions: numpy.ndarray,
+        learning_rate: float = 1.0,
+        history_size: int = 10,
+        initial_scale: float = 0.01,
+    ):
+        """
+        Full-batch L-BFGS over the flattened positions using the two-loop
+        recursion. There is no line search, the step is scaled by learning_rate
+
+        :param history_size: number of curvature pairs to keep
+        :param initial_scale: gradient scale used before any curvature pairs
+            are available
+        """
+        super().__init__(positions, learning_rate)
+        self._history_size = history_size
+        self._initial_scale = initial_scale
+
+        self._position_differences = []
+        self._gradient_differences = []
+        self._prev_positions = None
+        self._prev_gradients = None
+
+    def _calc_change(self, gradients: numpy.ndarray, indices: numpy.ndarray) -> numpy.ndarray:
+        if len(indices) != len(self._positions):
+            raise ValueError("LBFGS only supports full-batch steps")
+
+        flat_positions = self._positions[indices].ravel()
+        flat_gradients = gradients.ravel()
+
+        if self._prev_gradients is not None:
+            position_difference = flat_positions - self._prev_positions
+            gradient_difference = flat_gradients - self._prev_gradients
+
+            # skip pairs which would break positive definiteness
+            if position_difference @ gradient_difference > 1e-10:
+                self._position_differences.append(position_difference)
+                self._gradient_differences.append(gradient_difference)
+                if len(self._position_differences) > self._history_size:
+                    self._position_differences.pop(0)
+                    self._gradient_differences.pop(0)
+
+        self._prev_positions = flat_positions
+        self._prev_gradients = flat_gradients
+
+        direction = self._calc_direction(flat_gradients)
+        return self._learning_rate * direction.reshape(gradients.shape)
+
+    def _calc_direction(self, flat_gradients: numpy.ndarray) -> numpy.ndarray:
+        if not self._position_differences:
+            return flat_gradients * self._initial_scale
+
+        q = flat_gradients.copy()
+        pairs = list(zip(self._position_differences, self._gradient_differences))
+        rhos = [1.0 / (y @ s) for s, y in pairs]
+
+        alphas = []
+        for (s, y), rho in zip(reversed(pairs), reversed(rhos)):
+            alpha = rho * (s @ q)
+            q -= alpha * y
+            alphas.append(alpha)
+
+        s, y = pairs[-1]
+        r = q * (s @ y) / (y @ y)
+
+        for (s, y), rho, alpha in zip(pairs, rhos, reversed(alphas)):
+            beta = rho * (y @ r)
+            r += s * (alpha - beta)
+
+        return r
+
+    def state_dict(self) -> Dict[str, numpy.ndarray]:
+        num_values = self._positions.size
+        has_prev = self._prev_gradients is not None
+        return {
+            **super().state_dict(),
+            "position_differences": numpy.reshape(self._position_differences, (-1, num_values)),
+            "gradient_differences": numpy.reshape(self._gradient_differences, (-1, num_values)),
+            "prev_positions": self._prev_positions if has_prev else numpy.zeros(0),
+            "prev_gradients": self._prev_gradients if has_prev else numpy.zeros(0),
+        }
+
+    def load_state_dict(self, state_dict: Dict[str, numpy.ndarray]):
+        super().load_state_dict(state_dict)
+        self._position_differences = list(state_dict["position_differences"])
+        self._gradient_differences = list(state_dict["gradient_differences"])
+
+        has_prev = len(state_dict["prev_gradients"]) > 0
+        self._prev_positions = state_dict["prev_positions"] if has_prev else None
+        self._prev_gradients = state_dict["prev_gradients"] if has_prev else None
+
+# optimizers whose steps require the gradients of every point
+FULL_BATCH_OPTIMIZERS = ("lbfgs", )
+
+def create_optimizer(
+    name: str,
+    positions: numpy.ndarray,
+    learning_rate: float = 0.01,
+    momentum: float = 0.9,
+) -> Optimizer:
+    if name == "sgd":
+        return SGD(positions, learning_rate=learning_rate, momentum=momentum)
+    if name == "nesterov":
+        return Nesterov(positions, learning_rate=learning_rate, momentum=momentum)
+    if name == "adam":
+        return Adam(positions, learning_rate=learning_rate)
+    if name == "lbfgs":
+        return LBFGS(positions, learning_rate=learning_rate)
+
+    raise ValueError(f"Unknown optimizer {name}")
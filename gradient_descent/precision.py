@@ -0,0 +1,28 @@
+import numpy
+
+PRECISIONS = {
+    "float32": numpy.float32,
+    "float64": numpy.float64,
+}
+
+# layouts with at least this many points default to float32
+LARGE_LAYOUT_POINTS = 5000
+
+def resolve_dtype(precision: str, num_points: int) -> numpy.dtype:
+    """
+    Positions, target distances, losses and optimizer state all share one
+    dtype so that no operation in the optimization loop upcasts. float32
+    halves memory and bandwidth, which dominates for large dense layouts,
+    while small layouts default to float64
+
+    :param precision: "float32", "float64" or "auto"
+    :param num_points: number of points being optimized
+    :return: dtype of the optimization arrays
+    """
+    if precision == "auto":
+        precision = "float32" if num_points >= LARGE_LAYOUT_POINTS else "float64"
+
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision}")
+
+    return numpy.dtype(PRECISIONS[precision])
@@ -0,0 +1,98 @@
+from typing import Any, Callable, Dict, Optional
+
+import time
+import json
+import contextlib
+
+class Profiler():
+    def __init__(
+        self,
+        report_seconds: Optional[float] = None,
+        reporter: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        """
+        Cumulative wall time per named phase and named counters. Phases are
+        timed with
+
+            with profiler.phase("gradient"):
+                ...
+
+        :param report_seconds: if set, report every this many seconds from
+            step()
+        :param reporter: called with the report, defaults to printing it as
+            json
+        """
+        self._report_seconds = report_seconds
+        self._reporter = reporter or print_report
+
+        self.phase_times = {}
+        self.phase_counts = {}
+        self.counters = {}
+        self.steps = 0
+
+        self._start_time = time.perf_counter()
+        self._last_report_time = self._start_time
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_times[name] = self.phase_times.get(name, 0.0) + time.perf_counter() - start_time
+            self.phase_counts[name] = self.phase_counts.get(name, 0) + 1
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def step(self):
+        self.steps += 1
+
+        if self._report_seconds is not None:
+            current_time = time.perf_counter()
+            if current_time - self._last_report_time >= self._report_seconds:
+                self._last_report_time = current_time
+                self._reporter(self.report())
+
+    def report(self) -> Dict[str, Any]:
+        """
+        :return: elapsed time, steps per second, counters and the total time,
+            call count and fraction of elapsed time of each phase
+        """
+        elapsed_time = time.perf_counter() - self._start_time
+        return {
+            "elapsed_time": elapsed_time,
+            "steps": self.steps,
+            "steps_per_second": self.steps / elapsed_time if elapsed_time > 0.0 else 0.0,
+            "counters": dict(self.counters),
+            "phases": {
+                name: {
+                    "time": phase_time,
+                    "calls": self.phase_counts[name],
+                    "fraction": phase_time / elapsed_time if elapsed_time > 0.0 else 0.0,
+                }
+                for name, phase_time in self.phase_times.items()
+            },
+        }
+
+class NullProfiler():
+    """
+    Profiler with the same interface which records nothing, so that
+    instrumented code costs close to nothing when profiling is disabled
+    """
+    _null_context = contextlib.nullcontext()
+
+    def phase(self, name: str):
+        return self._null_context
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+    def step(self):
+        pass
+
+    def report(self) -> Dict[str, Any]:
+        return {}
+
+def print_report(report: Dict[str, Any]):
+    print(json.dumps(report, indent=2))
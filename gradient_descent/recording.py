@@ -0,0 +1,99 @@
+from typing import List, Optional
+
+import numpy
+
+class PositionRecorder():
+    def __init__(
+        self,
+        every_steps: int = 10,
+        max_frames: int = 1000,
+        dtype: numpy.dtype = numpy.float32,
+    ):
+        """
+        Records a snapshot of the positions every every_steps steps into a
+        preallocated (max_frames, N, D) array, for rendering afterwards with
+        render.py. Recording only copies positions, so it costs the
+        optimizer O(N * D) every every_steps steps. Once the array is full,
+        every other frame is dropped and the stride doubles, so long runs
+        keep evenly spaced frames in bounded memory
+
+        :param every_steps: initial number of steps between frames
+        :param max_frames: maximum number of frames kept
+        :param dtype: dtype of the recorded positions
+        """
+        self.every_steps = every_steps
+        self._max_frames = max_frames
+        self._dtype = dtype
+
+        self._positions = None
+        self._steps = numpy.zeros(max_frames, dtype=numpy.int64)
+        self._losses = numpy.zeros(max_frames)
+        self.num_frames = 0
+
+    @property
+    def positions(self) -> numpy.ndarray:
+        """
+        :return: (num_frames, N, D) recorded positions
+        """
+        if self._positions is None:
+            return numpy.zeros((0, 0, 0), dtype=self._dtype)
+
+        return self._positions[:self.num_frames]
+
+    @property
+    def steps(self) -> numpy.ndarray:
+        """
+        :return: step of each frame
+        """
+        return self._steps[:self.num_frames]
+
+    @property
+    def losses(self) -> numpy.ndarray:
+        """
+        :return: total loss of each frame
+        """
+        return self._losses[:self.num_frames]
+
+    def record(self, steps: int, positions: numpy.ndarray, total_loss: float):
+        """
+        :param steps: total steps taken
+        :param positions: (N, D) current positions
+        :param total_loss: current total loss
+        """
+        if steps % self.every_steps != 0:
+            return
+
+        if self._positions is None:
+            self._positions = numpy.zeros((self._max_frames, ) + positions.shape, dtype=self._dtype)
+
+        if self.num_frames == self._max_frames:
+            self._thin()
+
+        self._positions[self.num_frames] = positions
+        self._steps[self.num_frames] = steps
+        self._losses[self.num_frames] = total_loss
+        self.num_frames += 1
+
+    def save(self, recording_path: str, names: Optional[List[str]] = None):
+        """
+        :param recording_path: path of the .npz recording
+        :param names: optional name of each point
+        """
+        numpy.savez(
+            recording_path,
+            positions=self.positions,
+            steps=self.steps,
+            losses=self.losses,
+            names=numpy.array(names if names is not None else [], dtype=str),
+        )
+
+    def _thin(self):
+        # frames are at multiples of every_steps, keep those at multiples of
+        # twice every_steps
+        num_kept = self.num_frames // 2
+        self._positions[:num_kept] = self._positions[1:self.num_frames:2]
+        self._steps[:num_kept] = self._steps[1:self.num_frames:2]
+        self._losses[:num_kept] = self._losses[1:self.num_frames:2]
+
+        self.num_frames = num_kept
+        self.every_steps *= 2
@@ -0,0 +1,237 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import os
+os.environ.setdefault("MPLBACKEND", "Agg")  # never open windows
+
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy
+from concurrent.futures import ProcessPoolExecutor
+
+parser = argparse.ArgumentParser(description="Render a recording of an optimization run")
+parser.add_argument("recording_path", type=str)
+parser.add_argument("--out_path", type=str, default="optimization.gif")
+parser.add_argument("--frames_dir", type=str, default=None)
+parser.add_argument("--workers", type=int, default=os.cpu_count())
+parser.add_argument("--fps", type=int, default=25)
+parser.add_argument("--dpi", type=int, default=100)
+parser.add_argument("--point_size", type=float, default=None)
+parser.add_argument("--labels", action="store_true")
+
+def load_recording(recording_path: str) -> Dict[str, Any]:
+    """
+    :param recording_path: path of a recording saved by PositionRecorder
+    :return: dictionary of positions, steps, losses and names
+    """
+    with numpy.load(recording_path) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+def calc_limits(positions: numpy.ndarray, margin: float = 0.05) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Every frame shares the same limits so that the view does not jump
+
+    :param positions: (F, N, D) recorded positions
+    :param margin: fraction of the extent added on each side
+    :return: lower and upper limit of each dimension
+    """
+    lower = numpy.min(positions, axis=(0, 1))
+    upper = numpy.max(positions, axis=(0, 1))
+    padding = numpy.maximum(upper - lower, 1e-12) * margin
+
+    return lower - padding, upper + padding
+
+def render_frame_range(
+    frames_dir: str,
+    first_frame: int,
+    positions: numpy.ndarray,
+    steps: numpy.ndarray,
+    losses: numpy.ndarray,
+    names: numpy.ndarray,
+    limits: Tuple[numpy.ndarray, numpy.ndarray],
+    dpi: int = 100,
+    point_size: Optional[float] = None,
+    labels: bool = False,
+) -> List[str]:
+    """
+    Renders a contiguous range of frames to png files, intended to be run
+    in a worker process. The figure is created once and only its offsets
+    and title change between frames
+
+    :param frames_dir: directory the frames are written to
+    :param first_frame: index of the first frame in the recording
+    :param positions: (F, N, D) positions of the frames in the range
+    :param steps: step of each frame in the range
+    :param losses: total loss of each frame in the range
+    :param names: name of each point, may be empty
+    :param limits: axis limits, see calc_limits
+    :param dpi: resolution of the frames
+    :param point_size: marker size, defaults to smaller markers for more points
+    :param labels: annotate each point with its name
+    :return: paths of the rendered frames
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    num_points = positions.shape[1]
+
+    figure, axes = plt.subplots(figsize=(6, 6), dpi=dpi)
+    axes.set_xlim(limits[0][0], limits[1][0])
+    axes.set_ylim(limits[0][1], limits[1][1])
+    axes.set_aspect("equal")
+    scatter_plot = axes.scatter(
+        positions[0, :, 0],
+        positions[0, :, 1],
+        s=point_size if point_size is not None else max(1.0, 2000.0 / num_points),
+    )
+    texts = (
+        [axes.annotate(name, position) for name, position in zip(names, positions[0, :, :2])]
+        if labels and len(names) == num_points else []
+    )
+
+    frame_paths = []
+    for frame_i in range(len(positions)):
+        scatter_plot.set_offsets(positions[frame_i, :, :2])
+        for text, position in zip(texts, positions[frame_i, :, :2]):
+            text.set_position(position)
+        axes.set_title(f"step {steps[frame_i]} | loss {losses[frame_i]:0.4f}")
+
+        frame_path = os.path.join(frames_dir, f"frame_{first_frame + frame_i:05d}.png")
+        figure.savefig(frame_path)
+        frame_paths.append(frame_path)
+
+    plt.close(figure)
+    return frame_paths
+
+def render_frames(
+    recording: Dict[str, Any],
+    frames_dir: str,
+    workers: int = 1,
+    **render_kwargs,
+) -> List[str]:
+    """
+    Splits the frames of a recording into one contiguous range per worker
+    and renders the ranges in a process pool. Each worker only receives the
+    positions of its own range
+
+    :param recording: recording returned by load_recording
+    :param frames_dir: directory the frames are written to
+    :param workers: number of worker processes
+    :param render_kwargs: keyword arguments passed to render_frame_range
+    :return: paths of the rendered frames in order
+    """
+    positions = recording["positions"]
+    num_frames = len(positions)
+    if num_frames == 0:
+        raise ValueError("Recording has no frames")
+
+    limits = calc_limits(positions)
+    workers = max(1, min(workers, num_frames))
+    bounds = numpy.linspace(0, num_frames, workers + 1).astype(int)
+    ranges = [
+        (
+            frames_dir,
+            start,
+            positions[start:stop],
+            recording["steps"][start:stop],
+            recording["losses"][start:stop],
+            recording["names"],
+            limits,
+        )
+        for start, stop in zip(bounds[:-1], bounds[1:])
+    ]
+
+    if workers == 1:
+        return render_frame_range(*ranges[0], **render_kwargs)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(render_frame_range, *frame_range, **render_kwargs)
+            for frame_range in ranges
+        ]
+        return [frame_path for future in futures for frame_path in future.result()]
+
+def write_gif(frame_paths: List[str], out_path: str, fps: int = 25):
+    """
+    :param frame_paths: paths of the frames in order
+    :param out_path: path of the gif
+    :param fps: frames per second
+    """
+    from PIL import Image
+
+    Image.open(frame_paths[0]).save(
+        out_path,
+        save_all=True,
+        append_images=(Image.open(frame_path) for frame_path in frame_paths[1:]),
+        duration=1000 / fps,
+        loop=0,
+    )
+
+def write_mp4(frames_dir: str, out_path: str, fps: int = 25):
+    """
+    :param frames_dir: directory of frames named by render_frame_range
+    :param out_path: path of the mp4
+    :param fps: frames per second
+    """
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg is required to write mp4 files")
+
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-framerate", str(fps),
+            "-i", os.path.join(frames_dir, "frame_%05d.png"),
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-pix_fmt", "yuv420p",
+            out_path,
+        ],
+        check=True,
+    )
+
+def render_recording(
+    recording_path: str,
+    out_path: str,
+    frames_dir: Optional[str] = None,
+    workers: int = 1,
+    fps: int = 25,
+    **render_kwargs,
+):
+    """
+    Renders a recording to a gif or mp4, chosen by the extension of out_path
+
+    :param recording_path: path of the recording
+    :param out_path: path of the gif or mp4
+    :param frames_dir: directory to keep the png frames in, defaults to a
+        temporary directory
+    :param workers: number of worker processes
+    :param fps: frames per second
+    :param render_kwargs: keyword arguments passed to render_frame_range
+    """
+    if not out_path.endswith((".gif", ".mp4")):
+        raise ValueError("out_path must end with .gif or .mp4")
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        frames_dir = frames_dir or temporary_dir
+        os.makedirs(frames_dir, exist_ok=True)
+
+        frame_paths = render_frames(load_recording(recording_path), frames_dir, workers, **render_kwargs)
+        if out_path.endswith(".gif"):
+            write_gif(frame_paths, out_path, fps)
+        else:
+            write_mp4(frames_dir, out_path, fps)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    render_recording(
+        args.recording_path,
+        args.out_path,
+        frames_dir=args.frames_dir,
+        workers=args.workers,
+        fps=args.fps,
+        dpi=args.dpi,
+        point_size=args.point_size,
+        labels=args.labels,
+    )
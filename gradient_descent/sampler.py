@@ -0,0 +1,204 @@
+from typing import Dict
+
+import numpy
+
+class SumTree():
+    def __init__(self, weights: numpy.ndarray):
+        """
+        Binary tree stored in a flat array where each internal node holds the
+        sum of its children and the leaves hold the weights. Supports
+        O(log N) weight updates and weighted sampling
+
+        :param weights: non-negative sampling weight of each index
+        """
+        self._num_leaves = len(weights)
+        self._capacity = 1 << int(numpy.ceil(numpy.log2(max(self._num_leaves, 1))))
+        self._tree = numpy.zeros(2 * self._capacity)
+
+        self.build(weights)
+
+    @property
+    def total(self) -> float:
+        return self._tree[1]
+
+    def build(self, weights: numpy.ndarray):
+        self._tree[:] = 0.0
+        self._tree[self._capacity: self._capacity + self._num_leaves] = weights
+        self._build_internal_nodes()
+
+    def _build_internal_nodes(self):
+        level_start = self._capacity // 2
+        while level_start >= 1:
+            nodes = numpy.arange(level_start, 2 * level_start)
+            self._tree[nodes] = self._tree[2 * nodes] + self._tree[2 * nodes + 1]
+            level_start //= 2
+
+    def update(self, indices: numpy.ndarray, weights: numpy.ndarray):
+        """
+        :param indices: indices whose weights have changed
+        :param weights: new weights of indices
+        """
+        nodes = numpy.atleast_1d(indices) + self._capacity
+        self._tree[nodes] = weights
+
+        # a single vectorized pass over every level is cheaper than
+        # walking up from many leaves
+        if len(nodes) * numpy.log2(self._capacity) >= self._capacity:
+            self._build_internal_nodes()
+            return
+
+        # for a few leaves, walking up in python beats per-level numpy calls
+        if len(nodes) <= 32:
+            tree = self._tree
+            for node in nodes.tolist():
+                node //= 2
+                while node >= 1:
+                    tree[node] = tree[2 * node] + tree[2 * node + 1]
+                    node //= 2
+            return
+
+        # parents of sorted nodes are sorted, so duplicates are adjacent
+        nodes = numpy.unique(nodes) // 2
+        while nodes[0] >= 1:
+            nodes = nodes[numpy.concatenate([[True], nodes[1:] != nodes[:-1]])]
+            self._tree[nodes] = self._tree[2 * nodes] + self._tree[2 * nodes + 1]
+            nodes //= 2
+
+    def get(self, index: int) -> float:
+        return self._tree[index + self._capacity]
+
+    def sample(self) -> int:
+        """
+        :return: index sampled with probability proportional to its weight
+        """
+        value = numpy.random.uniform(0.0, self.total)
+
+        node = 1
+        while node < self._capacity:
+            left = 2 * node
+            # the second check guards against rounding past the last weight
+            if value < self._tree[left] or self._tree[left + 1] <= 0.0:
+                node = left
+            else:
+                value -= self._tree[left]
+                node = left + 1
+
+        return node - self._capacity
+
+class TemperatureSampler():
+    def __init__(
+        self,
+        losses: numpy.ndarray,
+        temperature: float,
+        rebuild_tolerance: float = 0.01,
+        max_exponent: float = 50.0,
+    ):
+        """
+        Samples indices with probability softmax(losses / temperature), the
+        same distribution as numpy_softmax, using a SumTree. Weights are
+        exp((loss - offset) / temperature) where offset is the maximum loss at
+        the last rebuild. Because every weight depends on the temperature,
+        the tree is only rebuilt once the temperature has drifted by more
+        than rebuild_tolerance (relative), or once the losses move so far from
+        the offset that the weights risk overflowing or underflowing
+
+        :param losses: loss of each index
+        :param temperature: initial temperature, clamped to at least 1
+        :param rebuild_tolerance: relative temperature change which triggers
+            a rebuild
+        :param max_exponent: largest exponent allowed before a rebuild
+        """
+        self._losses = numpy.array(losses, dtype=numpy.float64)
+        self._temperature = max(temperature, 1)
+        self._rebuild_tolerance = rebuild_tolerance
+        self._max_exponent = max_exponent
+
+        self._offset = numpy.max(self._losses)
+        self._tree = SumTree(self._calc_weights(self._losses))
+
+    def set_temperature(self, temperature: float):
+        temperature = max(temperature, 1)
+        if abs(temperature - self._temperature) > self._rebuild_tolerance * self._temperature:
+            self._temperature = temperature
+            self.rebuild()
+
+    def rebuild(self):
+        self._offset = numpy.max(self._losses)
+        self._tree.build(self._calc_weights(self._losses))
+
+    def update(self, indices: numpy.ndarray, losses: numpy.ndarray):
+        """
+        :param indices: indices whose losses have changed
+        :param losses: new losses of indices
+        """
+        self._losses[indices] = losses
+        if numpy.max(losses) - self._offset > self._max_exponent * self._temperature:
+            self.rebuild()
+        else:
+            self._tree.update(indices, self._calc_weights(losses))
+
+    def sample(self) -> int:
+        self._check_underflow()
+        return self._tree.sample()
+
+    def state_dict(self) -> Dict[str, numpy.ndarray]:
+        """
+        :return: arrays needed to continue sampling exactly, including the
+            tree whose sums may differ from a rebuild by rounding
+        """
+        return {
+            "losses": self._losses,
+            "temperature": numpy.array(self._temperature),
+            "offset": numpy.array(self._offset),
+            "tree": self._tree._tree,
+        }
+
+    def load_state_dict(self, state_dict: Dict[str, numpy.ndarray]):
+        self._losses[:] = state_dict["losses"]
+        self._temperature = float(state_dict["temperature"])
+        self._offset = float(state_dict["offset"])
+        self._tree._tree[:] = state_dict["tree"]
+
+    def sample_batch(self, size: int) -> numpy.ndarray:
+        """
+        Once every index with a nonzero weight has been sampled, the rest of
+        the batch is drawn uniformly from the unsampled indices, so that
+        indices are always unique
+
+        :param size: number of indices to sample, at most the number of indices
+        :return: indices sampled without replacement
+        """
+        self._check_underflow()
+
+        indices = numpy.empty(size, dtype=int)
+        weights = numpy.empty(size)
+        num_sampled = 0
+        while num_sampled < size and self._tree.total > 0.0:
+            index = self._tree.sample()
+            weight = self._tree.get(index)
+            if weight <= 0.0: break
+
+            indices[num_sampled] = index
+            weights[num_sampled] = weight
+            self._tree.update(index, 0.0)
+            num_sampled += 1
+
+        self._tree.update(indices[:num_sampled], weights[:num_sampled])
+
+        if num_sampled < size:
+            is_unsampled = numpy.ones(len(self._losses), dtype=bool)
+            is_unsampled[indices[:num_sampled]] = False
+            indices[num_sampled:] = numpy.random.choice(
+                numpy.flatnonzero(is_unsampled),
+                size - num_sampled,
+                replace=False
+            )
+
+        return indices
+
+    def _check_underflow(self):
+        if self._tree.total < numpy.exp(-1 * self._max_exponent):
+            self.rebuild()
+
+    def _calc_weights(self, losses: numpy.ndarray) -> numpy.ndarray:
+        return numpy.exp((losses - self._offset) / self._temperature)
@@ -0,0 +1,52 @@
+from typing import Optional, Tuple
+
+import numpy
+
+class SnapshotBuffer():
+    def __init__(self, shape: Tuple[int, ...], dtype: numpy.dtype = numpy.float64):
+        """
+        Double buffered copies of an array for handing positions from the
+        optimizer thread to a reader such as the animator without locks.
+        The writer always copies into the back buffer and then publishes it
+        by incrementing the sequence number. A reader copies the front buffer
+        and retries if a publish began overwriting it in the meantime
+
+        :param shape: shape of the published array
+        :param dtype: dtype of the published array
+        """
+        self._buffers = (numpy.zeros(shape, dtype=dtype), numpy.zeros(shape, dtype=dtype))
+        self._sequence = 0
+
+    @property
+    def sequence(self) -> int:
+        return self._sequence
+
+    def publish(self, array: numpy.ndarray):
+        """
+        Must only be called from a single writer thread
+
+        :param array: array to copy into the back buffer
+        """
+        numpy.copyto(self._buffers[(self._sequence + 1) % 2], array)
+        self._sequence += 1
+
+    def read(self, max_retries: int = 8) -> Optional[numpy.ndarray]:
+        """
+        :param max_retries: number of times to retry a read which raced with
+            the writer
+        :return: copy of the most recently published array, or None if
+            nothing has been published or every retry raced
+        """
+        for _ in range(max_retries):
+            sequence = self._sequence
+            if sequence == 0:
+                return None
+
+            snapshot = self._buffers[sequence % 2].copy()
+
+            # once the next sequence is published the writer may already be
+            # overwriting this buffer with the one after
+            if self._sequence == sequence:
+                return snapshot
+
+        return None
@@ -0,0 +1,142 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+import os
+os.environ.setdefault("MPLBACKEND", "Agg")  # never open windows
+
+import sys
+import copy
+import json
+import argparse
+import numpy
+
+from main import (
+    add_optimize_arguments,
+    load_problem,
+    spawn_seeds,
+    get_checkpoint_path,
+    get_recording_path,
+    run_restart,
+    run_restarts,
+    validate_arguments,
+)
+from models import Point
+from helpers import plot_points, plot_loss
+
+parser = argparse.ArgumentParser(description="Optimize points without plotting or animating")
+add_optimize_arguments(parser)
+parser.add_argument("--out_path", type=str, default=None)
+parser.add_argument("--plot_dir", type=str, default=None)
+
+def run_sequential_restarts(
+    points: List[Point],
+    seeds: List[int],
+    optimize_kwargs: Dict[str, Any],
+    minimum_loss: float = 0.0,
+    checkpoint_dir: Optional[str] = None,
+    record_dir: Optional[str] = None,
+):
+    """
+    In-process equivalent of run_restarts. Each restart optimizes its own
+    copy of points, and no restarts are started once one reaches
+    minimum_loss
+    """
+    for iteration_i, seed in enumerate(seeds):
+        result = run_restart(
+            copy.deepcopy(points),
+            seed,
+            optimize_kwargs,
+            get_checkpoint_path(checkpoint_dir, iteration_i),
+            get_recording_path(record_dir, iteration_i),
+        )
+        yield result
+
+        if result["loss"] <= minimum_loss:
+            return
+
+def summarize_results(results: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    :param results: results of run_restart
+    :return: positions, names, loss history and stop reason of the best
+        restart, and the seed, loss, stop reason and profile of every restart
+    """
+    best_result = None
+    restarts = []
+    for result in results:
+        restarts.append({
+            key: result[key]
+            for key in ("seed", "loss", "stop_reason", "profile")
+            if key in result
+        })
+        if best_result is None or result["loss"] < best_result["loss"]:
+            best_result = result
+
+    return {
+        "loss": float(best_result["loss"]),
+        "stop_reason": best_result["stop_reason"],
+        "seed": best_result["seed"],
+        "names": [point.name for point in best_result["points"]],
+        "positions": numpy.array([point.position for point in best_result["points"]]),
+        "losses": numpy.asarray(best_result["losses"]),
+        "points": best_result["points"],
+        "restarts": restarts,
+    }
+
+def write_summary(summary: Dict[str, Any], out_path: Optional[str] = None):
+    """
+    Writes the summary as .npz if out_path ends with .npz, otherwise as JSON
+    to out_path or to stdout if out_path is None
+
+    :param summary: summary returned by summarize_results
+    :param out_path: path of the output file
+    """
+    if out_path is not None and out_path.endswith(".npz"):
+        numpy.savez(
+            out_path,
+            positions=summary["positions"],
+            names=numpy.array(summary["names"]),
+            losses=summary["losses"],
+            loss=numpy.array(summary["loss"]),
+            restart_seeds=numpy.array([restart["seed"] for restart in summary["restarts"]]),
+            restart_losses=numpy.array([restart["loss"] for restart in summary["restarts"]]),
+        )
+        return
+
+    output = {
+        key: value.tolist() if isinstance(value, numpy.ndarray) else value
+        for key, value in summary.items()
+        if key != "points"
+    }
+    if out_path is None:
+        json.dump(output, sys.stdout)
+        sys.stdout.write("\n")
+    else:
+        with open(out_path, "w") as json_file:
+            json.dump(output, json_file)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    points, graph = load_problem(args.dataset, args.graph_path)
+    try:
+        validate_arguments(vars(args), len(points))
+    except ValueError as error:
+        parser.error(str(error))
+    seeds = spawn_seeds(args.seed, args.iterations)
+    optimize_kwargs = {**vars(args), "graph": graph}
+
+    for output_dir in (args.checkpoint_dir, args.record_dir):
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    results = (
+        run_restarts(points, seeds, args.workers, optimize_kwargs, args.minimum_loss, args.checkpoint_dir, args.record_dir)
+        if args.workers > 1
+        else run_sequential_restarts(points, seeds, optimize_kwargs, args.minimum_loss, args.checkpoint_dir, args.record_dir)
+    )
+    summary = summarize_results(results)
+    write_summary(summary, args.out_path)
+
+    if args.plot_dir:
+        os.makedirs(args.plot_dir, exist_ok=True)
+        plot_points(summary["points"], out_path=os.path.join(args.plot_dir, "best_points.png"))
+        plot_loss(summary["losses"], out_path=os.path.join(args.plot_dir, "best_loss.png"))
@@ -0,0 +1,44 @@
+from typing import Tuple
+
+import itertools
+import numpy
+
+def find_close_pairs(positions: numpy.ndarray, radius: float) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Finds all ordered pairs of points closer than radius using a uniform grid
+    with cells of size radius, so that only points in the 3^D neighboring
+    cells need to be compared. For roughly uniform densities this costs
+    O(N log N) rather than O(N^2)
+
+    :param positions: (N, D) array of positions
+    :param radius: distance below which pairs are returned
+    :return: row and column index arrays of pairs (i, j), i != j, which are
+        closer than radius. Both (i, j) and (j, i) are returned
+    """
+    num_points, num_dims = positions.shape
+
+    cells = numpy.floor(positions / radius).astype(numpy.int64)
+    cells -= numpy.min(cells, axis=0)
+    grid_shape = tuple(numpy.max(cells, axis=0) + 3)  # padding for offsets
+    keys = numpy.ravel_multi_index((cells + 1).T, grid_shape)
+
+    order = numpy.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    all_rows, all_columns = [], []
+    for offset in itertools.product((-1, 0, 1), repeat=num_dims):
+        neighbor_keys = numpy.ravel_multi_index((cells + 1 + numpy.array(offset)).T, grid_shape)
+        starts = numpy.searchsorted(sorted_keys, neighbor_keys, side="left")
+        counts = numpy.searchsorted(sorted_keys, neighbor_keys, side="right") - starts
+
+        # expand each point's [start, start + count) range of candidates
+        rows = numpy.repeat(numpy.arange(num_points), counts)
+        range_offsets = numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        columns = order[numpy.repeat(starts, counts) + numpy.arange(len(rows)) - range_offsets]
+
+        distances = numpy.linalg.norm(positions[rows] - positions[columns], axis=1)
+        is_close = (distances < radius) & (rows != columns)
+        all_rows.append(rows[is_close])
+        all_columns.append(columns[is_close])
+
+    return numpy.concatenate(all_rows), numpy.concatenate(all_columns)
@@ -0,0 +1,75 @@
+import numpy
+import pytest
+
+from benchmark import generate_problem
+from callback import Callback
+from convergence import ConvergenceMonitor
+from main import optimize_points
+from models import Point
+
+class Interrupted(Exception):
+    pass
+
+class InterruptingCallback(Callback):
+    def __init__(self, interrupt_steps: int):
+        super().__init__(verbose=False, every_steps=None)
+        self._interrupt_steps = interrupt_steps
+
+    def __call__(self, steps, *args, **kwargs):
+        super().__call__(steps, *args, **kwargs)
+        if steps == self._interrupt_steps:
+            raise Interrupted()
+
+def run(graph, checkpoint_path=None, resume=False, callback=None):
+    numpy.random.seed(7)
+    points = [
+        Point(position=position.tolist())
+        for position in numpy.random.normal(scale=100, size=(graph.num_points, 2))
+    ]
+    monitor = ConvergenceMonitor(relative_tolerance=0.2, window_steps=100, patience=1)
+    callback = callback or Callback(verbose=False, every_steps=None)
+    optimize_points(
+        points,
+        graph=graph,
+        learning_rate=0.05,
+        momentum=0.5,
+        max_steps=5000,
+        batch_size=4,
+        initial_temperature=10.0,
+        change_temperature=-0.01,
+        callback=callback,
+        monitor=monitor,
+        checkpoint_path=checkpoint_path,
+        checkpoint_steps=100,
+        resume=resume,
+    )
+
+    return numpy.array([point.position for point in points]), callback.losses, monitor.stop_reason
+
+def test_resumed_run_matches_uninterrupted_run(tmp_path):
+    _, graph = generate_problem(40, 2, 0.3, 0.0, 100.0, seed=0)
+    checkpoint_path = str(tmp_path / "checkpoint.npz")
+
+    positions, losses, stop_reason = run(graph)
+    assert stop_reason == "converged"
+
+    # the last checkpoint is at step 200, a window boundary, and the run
+    # converges at the next boundary
+    with pytest.raises(Interrupted):
+        run(graph, checkpoint_path, callback=InterruptingCallback(interrupt_steps=250))
+    resumed_positions, resumed_losses, resumed_stop_reason = run(graph, checkpoint_path, resume=True)
+
+    assert resumed_stop_reason == stop_reason
+    assert len(resumed_losses) == len(losses)
+    assert numpy.array_equal(resumed_positions, positions)
+
+def test_resuming_a_finished_run_takes_no_steps(tmp_path):
+    _, graph = generate_problem(40, 2, 0.3, 0.0, 100.0, seed=0)
+    checkpoint_path = str(tmp_path / "checkpoint.npz")
+
+    positions, losses, _ = run(graph, checkpoint_path)
+    resumed_positions, resumed_losses, resumed_stop_reason = run(graph, checkpoint_path, resume=True)
+
+    assert resumed_stop_reason == "converged"
+    assert len(resumed_losses) == len(losses)
+    assert numpy.array_equal(resumed_positions, positions)
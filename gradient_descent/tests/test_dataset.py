@@ -0,0 +1,30 @@
+import os
+import numpy
+
+from models import Point, Graph
+from helpers import load_dataset_graph
+
+def test_load_dataset_graph_matches_dense_points(tmp_path):
+    rng = numpy.random.default_rng(0)
+    num_points = 30
+    dist = rng.uniform(1.0, 10.0, size=(num_points, num_points))
+    # asymmetric, so some pairs are only known in one direction
+    omega = rng.uniform(size=(num_points, num_points)) < 0.3
+    names = [f"point_{index}" for index in range(num_points)]
+
+    numpy.save(os.path.join(tmp_path, "dist.npy"), dist)
+    numpy.save(os.path.join(tmp_path, "omega.npy"), omega)
+    with open(os.path.join(tmp_path, "names.txt"), "w") as names_file:
+        names_file.write("\n".join(names))
+
+    expected = Graph.from_points([
+        Point(numpy.where(omega_row, dist_row, numpy.nan))
+        for dist_row, omega_row in zip(dist, omega)
+    ])
+    graph = load_dataset_graph(str(tmp_path), block_rows=7)
+
+    assert graph.num_points == num_points
+    assert graph.names == names
+    numpy.testing.assert_array_equal(graph.sources, expected.sources)
+    numpy.testing.assert_array_equal(graph.targets, expected.targets)
+    numpy.testing.assert_allclose(graph.distances, expected.distances)
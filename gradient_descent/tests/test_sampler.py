@@ -0,0 +1,43 @@
+import numpy
+
+from models import Point
+from loss import MSELoss
+from sampler import TemperatureSampler
+
+def test_sample_batch_is_unique_with_few_nonzero_weights():
+    # weights of all but three indices underflow to 0
+    losses = numpy.full(64, -1e6)
+    losses[[5, 17, 40]] = 0.0
+    sampler = TemperatureSampler(losses, temperature=1.0)
+
+    numpy.random.seed(0)
+    for _ in range(20):
+        indices = sampler.sample_batch(8)
+
+        assert len(numpy.unique(indices)) == 8
+        assert set([5, 17, 40]) <= set(indices.tolist())
+
+def test_sample_batch_restores_weights():
+    losses = numpy.random.default_rng(0).normal(size=32)
+    sampler = TemperatureSampler(losses, temperature=1.0)
+    total = sampler._tree.total
+
+    numpy.random.seed(0)
+    sampler.sample_batch(32)
+
+    assert numpy.isclose(sampler._tree.total, total)
+
+def test_update_ignores_duplicate_indices():
+    random_state = numpy.random.default_rng(0)
+    true_positions = random_state.uniform(0, 10, size=(20, 2))
+    distances = numpy.linalg.norm(true_positions[:, numpy.newaxis] - true_positions, axis=2)
+    points = [
+        Point(row.tolist(), position=random_state.normal(size=2).tolist())
+        for row in distances
+    ]
+    loss = MSELoss(points)
+
+    loss.positions[[3, 7]] += 1.0
+    loss.update(numpy.array([3, 3, 7, 3]))
+
+    assert numpy.allclose(loss.point_losses, loss.calc_point_losses())
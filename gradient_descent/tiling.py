@@ -0,0 +1,54 @@
+from typing import Callable, Optional
+
+from concurrent.futures import Executor
+
+def calc_tile_rows(
+    num_rows: int,
+    row_bytes: int,
+    memory_budget: Optional[int] = None,
+    num_threads: int = 1,
+) -> int:
+    """
+    :param num_rows: total number of rows
+    :param row_bytes: scratch bytes needed per row of a tile
+    :param memory_budget: maximum scratch bytes over all concurrent tiles,
+        None for a single tile of every row
+    :param num_threads: number of tiles processed concurrently
+    :return: number of rows per tile, at least 1
+    """
+    if memory_budget is None:
+        return max(num_rows, 1)
+
+    return max(1, min(num_rows, memory_budget // (max(row_bytes, 1) * num_threads)))
+
+def map_row_tiles(
+    function: Callable[[int, int], None],
+    num_rows: int,
+    tile_rows: int,
+    executor: Optional[Executor] = None,
+):
+    """
+    Calls function(start, stop) for consecutive tiles of rows. Each call is
+    expected to write only its own rows of preallocated outputs, so tiles
+    can run concurrently. NumPy releases the GIL inside its kernels, so a
+    thread pool executor spreads tiles over cores
+
+    :param function: function of the start and stop row of a tile
+    :param num_rows: total number of rows
+    :param tile_rows: number of rows per tile
+    :param executor: executor to run tiles on, None to run them in order on
+        the calling thread
+    """
+    tiles = [
+        (start, min(start + tile_rows, num_rows))
+        for start in range(0, num_rows, tile_rows)
+    ]
+
+    if executor is None or len(tiles) <= 1:
+        for start, stop in tiles:
+            function(start, stop)
+        return
+
+    futures = [executor.submit(function, start, stop) for start, stop in tiles]
+    for future in futures:
+        future.result()